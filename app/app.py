@@ -1,12 +1,21 @@
 import os
 
+from dal.drive_metadata_store import DriveMetadataStore
+from dal.google_api_executor import GoogleApiExecutor
 from dal.google_drive_dal import GoogleDriveDAL
+from dal.label_cache import LabelCache
+from dal.notion_content_store import NotionContentStore
 from dal.notion_dal import NotionDAL
+from dal.smm_cache import SmmCache
 from dal.todoist_dal import TodoistDAL
 from flask import Flask
+from managers.channel_manager import ChannelManager
 from managers.client_manager import ClientManager
+from managers.export_job_manager import ExportJobManager
 from models.client_map import ClientMap
+from services.caption_pipeline import CaptionPipeline
 from services.gemini_service import GeminiService
+from services.image_derivative_service import ImageDerivativeService
 from services.vision_service import VisionService
 
 
@@ -24,15 +33,141 @@ def create_app():
     app.config["CONTENT_DB_NOTION_ID"] = os.environ.get(
         "CONTENT_DB_NOTION_ID", "1e8add08074880faa661d372bdb63bce"
     )
+    app.config["DRIVE_DOWNLOAD_WORKERS"] = int(
+        os.environ.get("DRIVE_DOWNLOAD_WORKERS", "8")
+    )
+    # Authorized Drive transports shared by request threads and background workers
+    app.config["DRIVE_CLIENT_POOL_SIZE"] = int(
+        os.environ.get("DRIVE_CLIENT_POOL_SIZE", "16")
+    )
+    app.config["IMAGE_CACHE_MAX_MB"] = int(os.environ.get("IMAGE_CACHE_MAX_MB", "2048"))
+    # Drive quota: sustained requests/second shared by every Drive call in the process
+    app.config["DRIVE_REQUESTS_PER_SECOND"] = float(
+        os.environ.get("DRIVE_REQUESTS_PER_SECOND", "10")
+    )
+    app.config["DRIVE_API_DEADLINE"] = float(
+        os.environ.get("DRIVE_API_DEADLINE", "120")
+    )
+    # Notion allows about 3 requests/second per integration
+    app.config["NOTION_REQUESTS_PER_SECOND"] = float(
+        os.environ.get("NOTION_REQUESTS_PER_SECOND", "3")
+    )
+    # Seconds SMM page data is reused before checking its last_edited_time
+    app.config["SMM_CACHE_TTL"] = float(os.environ.get("SMM_CACHE_TTL", "300"))
+    app.config["DRIVE_METADATA_DB"] = os.environ.get(
+        "DRIVE_METADATA_DB", "drive_metadata.sqlite3"
+    )
+    # Seconds a folder listing in the local metadata mirror is trusted without Drive
+    app.config["DRIVE_METADATA_MAX_AGE"] = float(
+        os.environ.get("DRIVE_METADATA_MAX_AGE", "300")
+    )
+    app.config["NOTION_CONTENT_DB"] = os.environ.get(
+        "NOTION_CONTENT_DB", "notion_content.sqlite3"
+    )
+    # Seconds the local content database mirror may lag Notion before a read syncs it
+    app.config["NOTION_CONTENT_MAX_AGE"] = float(
+        os.environ.get("NOTION_CONTENT_MAX_AGE", "60")
+    )
+    # Seconds a rendered /captions digest is served before it is rebuilt
+    app.config["CAPTION_DIGEST_TTL"] = float(
+        os.environ.get("CAPTION_DIGEST_TTL", "300")
+    )
+    # Caption pipeline: worker threads per stage and Vision/Gemini request rates
+    app.config["CAPTION_DOWNLOAD_WORKERS"] = int(
+        os.environ.get("CAPTION_DOWNLOAD_WORKERS", "4")
+    )
+    app.config["CAPTION_VISION_WORKERS"] = int(
+        os.environ.get("CAPTION_VISION_WORKERS", "2")
+    )
+    app.config["CAPTION_GEMINI_WORKERS"] = int(
+        os.environ.get("CAPTION_GEMINI_WORKERS", "2")
+    )
+    app.config["VISION_REQUESTS_PER_SECOND"] = float(
+        os.environ.get("VISION_REQUESTS_PER_SECOND", "10")
+    )
+    # Labels requested per image, and images per batch_annotate_images request
+    app.config["VISION_MAX_RESULTS"] = int(os.environ.get("VISION_MAX_RESULTS", "10"))
+    app.config["VISION_BATCH_SIZE"] = int(os.environ.get("VISION_BATCH_SIZE", "16"))
+    # Vision labels by image content hash, reused when a photo is captioned again
+    app.config["LABEL_CACHE_DB"] = os.environ.get(
+        "LABEL_CACHE_DB", "vision_labels.sqlite3"
+    )
+    # Pages captioned per Gemini call when they share an SMM prompt
+    app.config["GEMINI_BATCH_SIZE"] = int(os.environ.get("GEMINI_BATCH_SIZE", "8"))
+    # Seconds a generated caption can be reused when the same page is retried
+    app.config["GEMINI_CACHE_TTL"] = float(os.environ.get("GEMINI_CACHE_TTL", "3600"))
+    app.config["GEMINI_REQUESTS_PER_SECOND"] = float(
+        os.environ.get("GEMINI_REQUESTS_PER_SECOND", "2")
+    )
+    # Public HTTPS address of /drive-webhook; channels are only opened when set
+    app.config["DRIVE_WEBHOOK_URL"] = os.environ.get("DRIVE_WEBHOOK_URL")
+    app.config["DRIVE_CHANNEL_TTL"] = int(os.environ.get("DRIVE_CHANNEL_TTL", "86400"))
+    # Run the channel renewal thread from run.py; enable in exactly one process
+    app.config["DRIVE_CHANNEL_SCHEDULER"] = (
+        os.environ.get("DRIVE_CHANNEL_SCHEDULER", "0") == "1"
+    )
+    # Worker threads sending export copy batches, shared by all export jobs
+    app.config["EXPORT_COPY_WORKERS"] = int(os.environ.get("EXPORT_COPY_WORKERS", "4"))
 
     # Initialise shared resources
     client_map = ClientMap()
     client_map.load_from_file(app.config["CLIENT_MAP_PATH"])
-    drive_dal = GoogleDriveDAL(app.config["SERVICE_ACCOUNT_FILE"])
-    notion_dal = NotionDAL(app.config["NOTION_TOKEN"])
+    drive_executor = GoogleApiExecutor(
+        requests_per_second=app.config["DRIVE_REQUESTS_PER_SECOND"],
+        deadline=app.config["DRIVE_API_DEADLINE"],
+    )
+    drive_metadata_store = DriveMetadataStore(
+        app.config["DRIVE_METADATA_DB"],
+        max_age=app.config["DRIVE_METADATA_MAX_AGE"],
+    )
+    drive_dal = GoogleDriveDAL(
+        app.config["SERVICE_ACCOUNT_FILE"],
+        download_workers=app.config["DRIVE_DOWNLOAD_WORKERS"],
+        image_cache_max_bytes=app.config["IMAGE_CACHE_MAX_MB"] * 1024 * 1024,
+        executor=drive_executor,
+        metadata_store=drive_metadata_store,
+        pool_size=app.config["DRIVE_CLIENT_POOL_SIZE"],
+    )
+    notion_dal = NotionDAL(
+        app.config["NOTION_TOKEN"],
+        requests_per_second=app.config["NOTION_REQUESTS_PER_SECOND"],
+    )
+    smm_cache = SmmCache(notion_dal, ttl=app.config["SMM_CACHE_TTL"])
+    content_store = NotionContentStore(
+        notion_dal,
+        app.config["CONTENT_DB_NOTION_ID"],
+        app.config["NOTION_CONTENT_DB"],
+        max_age=app.config["NOTION_CONTENT_MAX_AGE"],
+    )
     todoist_dal = TodoistDAL(app.config["TODOIST_TOKEN"])
-    vision_service = VisionService(app.config["SERVICE_ACCOUNT_FILE"])
-    gemini_service = GeminiService(app.config["GEMINI_API_KEY"])
+    vision_service = VisionService(
+        app.config["SERVICE_ACCOUNT_FILE"],
+        max_results=app.config["VISION_MAX_RESULTS"],
+        label_cache=LabelCache(app.config["LABEL_CACHE_DB"]),
+    )
+    gemini_service = GeminiService(
+        app.config["GEMINI_API_KEY"],
+        cache_ttl=app.config["GEMINI_CACHE_TTL"],
+        pool_size=app.config["CAPTION_GEMINI_WORKERS"],
+    )
+    image_derivatives = ImageDerivativeService(drive_dal.image_cache)
+    caption_pipeline = CaptionPipeline(
+        drive_dal,
+        vision_service,
+        gemini_service,
+        notion_dal,
+        smm_cache,
+        download_workers=app.config["CAPTION_DOWNLOAD_WORKERS"],
+        vision_workers=app.config["CAPTION_VISION_WORKERS"],
+        gemini_workers=app.config["CAPTION_GEMINI_WORKERS"],
+        vision_requests_per_second=app.config["VISION_REQUESTS_PER_SECOND"],
+        gemini_requests_per_second=app.config["GEMINI_REQUESTS_PER_SECOND"],
+        vision_batch_size=app.config["VISION_BATCH_SIZE"],
+        gemini_batch_size=app.config["GEMINI_BATCH_SIZE"],
+    )
+    export_jobs = ExportJobManager(
+        drive_dal, copy_workers=app.config["EXPORT_COPY_WORKERS"]
+    )
 
     client_manager = ClientManager(
         client_map,
@@ -41,6 +176,21 @@ def create_app():
         app.config["CONTENT_DB_NOTION_ID"],
         vision_service,
         gemini_service,
+        client_map_path=app.config["CLIENT_MAP_PATH"],
+        image_derivatives=image_derivatives,
+        smm_cache=smm_cache,
+        content_store=content_store,
+        caption_digest_ttl=app.config["CAPTION_DIGEST_TTL"],
+        caption_pipeline=caption_pipeline,
+    )
+
+    channel_manager = ChannelManager(
+        client_map,
+        drive_dal,
+        client_manager,
+        app.config["DRIVE_WEBHOOK_URL"],
+        client_map_path=app.config["CLIENT_MAP_PATH"],
+        ttl=app.config["DRIVE_CHANNEL_TTL"],
     )
 
     # Attach to app for access in routes
@@ -48,7 +198,12 @@ def create_app():
     app.drive_dal = drive_dal
     app.notion_dal = notion_dal
     app.todoist_dal = todoist_dal
+    app.image_derivatives = image_derivatives
+    app.vision_service = vision_service
+    app.gemini_service = gemini_service
     app.client_manager = client_manager
+    app.export_jobs = export_jobs
+    app.channel_manager = channel_manager
 
     # Register routes (directly or via blueprints)
     from routes import register_routes
@@ -1,12 +1,14 @@
-import os
 import re
 import time
 
+from dal.drive_metadata_store import DriveMetadataStore
+
 
 class ClientDriveDAL:
-    def __init__(self, client, drive_dal):
+    def __init__(self, client, drive_dal, image_derivatives=None):
         self.client = client
         self.drive_dal = drive_dal
+        self.image_derivatives = image_derivatives
 
     def get_ready_images(self):
         """
@@ -26,16 +28,24 @@ class ClientDriveDAL:
         files = self.drive_dal.list_images_with_grouping(fotos_id)
         print(f"Found {len(files)} images.")
 
-        images = []
+        image_files = []
         for file in files:
             if not file.get("mimeType", "").startswith("image/"):
                 print(
                     f"Skipping non-image file: {file.get('name', 'N/A')} ({file.get('mimeType', 'N/A')})"
                 )
                 continue  # Skip if it's not an image
+            image_files.append(file)
 
-            # Download the image locally (synchronously)
-            local_filename = self.drive_dal.download_file(file["id"], file["name"])
+        # Download the images locally, concurrently, keeping the listing order.
+        # The listing's own images are pinned so later downloads cannot evict
+        # the ones the response links to.
+        image_cache = self.drive_dal.image_cache
+        with image_cache.pinned(self.drive_dal.image_cache_key(f) for f in image_files):
+            downloads = self.drive_dal.download_files(image_files)
+        images = []
+        local_filenames = []
+        for file, local_filename, _ in downloads:
             if not local_filename:
                 print(f"Skipping {file['name']} as download failed.")
                 continue  # Skip if download failed
@@ -54,8 +64,21 @@ class ClientDriveDAL:
                     "thumbnailUrl": file.get("thumbnailLink"),
                     "mimeType": file.get("mimeType"),
                     "localUrl": local_url,  # <-- Added for frontend consumption
+                    "thumbnailLocalUrl": f"{local_url}?size=thumbnail",
+                    "previewLocalUrl": f"{local_url}?size=preview",
                 }
             )
+            local_filenames.append(local_filename)
+        listing_bytes = image_cache.size_of(local_filenames)
+        if listing_bytes > image_cache.max_bytes:
+            print(
+                f"WARNING: {len(local_filenames)} images take {listing_bytes // 2**20} MB, "
+                f"more than the {image_cache.max_bytes // 2**20} MB image cache; "
+                "raise IMAGE_CACHE_MAX_MB or some of them will be evicted."
+            )
+        if self.image_derivatives:
+            # Grid thumbnails are ready by the time the picker asks for them
+            self.image_derivatives.generate_in_background(local_filenames)
         print(f"Prepared {len(images)} image entries with Drive and local URLs.")
         images.sort(key=lambda x: (x["group"] or "", x["name"]))
 
@@ -101,29 +124,24 @@ class ClientDriveDAL:
             )
             return 0
 
+        allowed_mime_types = filters["allowed_mime_types"]
+        allowed_extensions = filters["allowed_extensions"]
+        count = 0
         try:
-            files = self.drive_dal.list_files_in_folder(subfolder_id)
+            # Stream the listing page by page; only the count is kept
+            for f in self.drive_dal.iter_files_in_folder(subfolder_id):
+                if not any(f["mimeType"].startswith(mt) for mt in allowed_mime_types):
+                    continue
+                if not any(
+                    f["name"].lower().endswith(ext) for ext in allowed_extensions
+                ):
+                    continue
+                count += 1
         except Exception as e:
             print(f"Error fetching files from Drive: {e}")
             return 0
 
-        # Filter by MIME type
-        allowed_mime_types = filters["allowed_mime_types"]
-        files = [
-            f
-            for f in files
-            if any(f["mimeType"].startswith(mt) for mt in allowed_mime_types)
-        ]
-
-        # Filter by extension
-        allowed_extensions = filters["allowed_extensions"]
-        files = [
-            f
-            for f in files
-            if any(f["name"].lower().endswith(ext) for ext in allowed_extensions)
-        ]
-
-        return len(files)
+        return count
 
     @staticmethod
     def parse_file_name(file_name):
@@ -143,43 +161,115 @@ class ClientDriveDAL:
             return group_key, num, letter, match_key
         return None, None, None, None
 
-    def move_matching_files(self, match_key):
+    def move_matching_files(self, match_keys):
+        """
+        Moves files from fotos_id to scheduling_id whose base name (without
+        extension) equals one of match_keys. Matches come from the metadata
+        store's name index when the fotos folder is fresh there, otherwise from
+        one listing of the folder; all moves are sent together as one batch.
+        Returns the number of files moved.
+        """
+        if isinstance(match_keys, str):
+            match_keys = [match_keys]
+        wanted = set(match_keys)
+        if not wanted:
+            return 0
         fotos_id = self.client.get_google_drive_id("fotos_id")
         scheduling_id = self.client.get_google_drive_id("scheduling_id")
+        moved = 0
         try:
-            fotos_files = self.drive_dal.list_files_in_folder(
-                fotos_id, fields="files(id, name, parents)"
-            )
-            found = False
-            for file in fotos_files:
-                base_name, _ = os.path.splitext(file["name"])
-                if base_name == match_key:
-                    self.drive_dal.service.files().update(
-                        fileId=file["id"],
-                        addParents=scheduling_id,
-                        removeParents=fotos_id,
-                        fields="id, parents",
-                    ).execute()
+            index = self.drive_dal.find_by_base_names(fotos_id, wanted)
+
+            batch = self.drive_dal.new_batch()
+            names = {}
+            for match_key in wanted:
+                if match_key not in index:
+                    print(f"File with base name '{match_key}' not found in fotos_id.")
+                    continue
+                for file in index[match_key]:
+                    names[file["id"]] = file["name"]
+                    batch.add(
+                        self.drive_dal.service.files().update(
+                            fileId=file["id"],
+                            addParents=scheduling_id,
+                            removeParents=fotos_id,
+                            fields=DriveMetadataStore.FILE_FIELDS,
+                        ),
+                        key=file["id"],
+                    )
+            for file_id, result in batch.execute().items():
+                if result.ok:
+                    self.drive_dal.record_file(result.response)
+                    moved += 1
                     print(
-                        f"Moved file '{file['name']}' from fotos_id to scheduling_id."
+                        f"Moved file '{names[file_id]}' from fotos_id to scheduling_id."
                     )
-                    found = True
-            if not found:
-                print(f"File with base name '{match_key}' not found in fotos_id.")
+                else:
+                    print(f"ERROR moving file '{names[file_id]}': {result.error}")
         except Exception as e:
-            print(f"ERROR moving file with base name '{match_key}': {e}")
+            print(f"ERROR moving files with base names {sorted(wanted)}: {e}")
+        return moved
 
-    def list_next_posts(self):
+    def iter_next_posts(self):
         next_post_id = self.client.get_google_drive_id("next_post_id")
-        return self.drive_dal.list_files_in_folder(
+        return self.drive_dal.iter_files_in_folder(
             next_post_id, fields="files(id, name, createdTime, parents)"
         )
 
-    def make_file_public(self, file_id):
-        try:
-            self.drive_dal.service.permissions().create(
-                fileId=file_id, body={"role": "reader", "type": "anyone"}, fields="id"
-            ).execute()
-            print(f"Made file {file_id} public.")
-        except Exception as e:
-            print(f"Could not make file public: {e}")
+    def list_next_posts(self):
+        return list(self.iter_next_posts())
+
+    def list_next_post_changes(self, page_token, known=None):
+        """
+        Uses the Drive Changes API to find what happened in next_post_id since
+        page_token. Returns (changed_files, removed_ids, new_page_token) where
+        changed_files are files added to or renamed inside the folder, and
+        removed_ids are files that were trashed there or deleted outright.
+        :param known: {file id: name} of files already synced; changes to them
+            that keep the name (permissions, metadata updates) are left out.
+        """
+        known = known or {}
+        next_post_id = self.client.get_google_drive_id("next_post_id")
+        changes, new_page_token = self.drive_dal.list_changes(page_token)
+
+        changed_files = []
+        removed_ids = []
+        for change in changes:
+            if change.get("removed"):
+                # Deleted or no longer visible; the parent is unknown at this point
+                removed_ids.append(change["fileId"])
+                continue
+            file = change.get("file") or {}
+            if next_post_id not in file.get("parents", []):
+                continue
+            if file.get("trashed"):
+                removed_ids.append(change["fileId"])
+            elif file.get("mimeType") == "application/vnd.google-apps.folder":
+                continue
+            elif known.get(file["id"]) != file["name"]:
+                changed_files.append(file)
+        return changed_files, removed_ids, new_page_token
+
+    def make_files_public(self, file_ids):
+        """
+        Grants 'anyone with the link' read access to all file_ids using batched
+        permissions.create calls. Returns the set of file ids that succeeded.
+        """
+        batch = self.drive_dal.new_batch()
+        for file_id in file_ids:
+            batch.add(
+                self.drive_dal.service.permissions().create(
+                    fileId=file_id,
+                    body={"role": "reader", "type": "anyone"},
+                    fields="id",
+                ),
+                key=file_id,
+            )
+        public = set()
+        for file_id, result in batch.execute().items():
+            if result.ok:
+                print(f"Made file {file_id} public.")
+                public.add(file_id)
+            else:
+                print(f"Could not make file {file_id} public: {result.error}")
+        return public
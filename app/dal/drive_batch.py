@@ -0,0 +1,94 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class BatchResult:
+    key: Any
+    response: Optional[dict] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class DriveBatch:
+    """
+    Collects Drive API requests (files.update, files.copy, permissions.create, ...)
+    and sends them through the batch endpoint in groups of up to MAX_BATCH_SIZE.
+    Each request is registered under a key, and execute() returns the response or
+    error for every key. With a client pool, every batch request is sent on a
+    checked-out transport instead of the service's own.
+    """
+
+    MAX_BATCH_SIZE = 100  # Drive API limit for calls per batch request
+
+    def __init__(
+        self, service, executor, batch_size: int = MAX_BATCH_SIZE, client_pool=None
+    ):
+        self.service = service
+        self.executor = executor
+        self.client_pool = client_pool
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+        self._requests: List[Tuple[Any, Any]] = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, request, key=None):
+        """Queue a request; the key defaults to its position in the batch."""
+        if key is None:
+            key = len(self._requests)
+        self._requests.append((key, request))
+        return key
+
+    def execute(self) -> Dict[Any, BatchResult]:
+        results = {}
+        pending, self._requests = self._requests, []
+        attempt = 0
+        while pending:
+            for start in range(0, len(pending), self.batch_size):
+                results.update(
+                    self._execute_chunk(pending[start : start + self.batch_size])
+                )
+            # Items rejected by rate limiting were never applied and can be resent
+            pending = [
+                (key, request)
+                for key, request in pending
+                if self.executor.is_rate_limit_error(results[key].error)
+            ]
+            if not pending or attempt >= self.executor.max_retries:
+                break
+            delay = self.executor.backoff_delay(attempt)
+            print(f"{len(pending)} batch items rate limited, resending in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+        return results
+
+    def _execute_chunk(self, chunk) -> Dict[Any, BatchResult]:
+        results = {}
+
+        def callback(request_id, response, exception):
+            key = chunk[int(request_id)][0]
+            results[key] = BatchResult(key, response, exception)
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for i, (key, request) in enumerate(chunk):
+            batch.add(request, request_id=str(i))
+
+        def send():
+            if self.client_pool is None:
+                return batch.execute()
+            with self.client_pool.client() as client:
+                return batch.execute(http=client.http)
+
+        try:
+            # Each call inside a batch counts against quota individually
+            self.executor.call(send, cost=len(chunk), idempotent=False)
+        except Exception as e:
+            # The whole batch call failed; every item without a result shares the error
+            for key, _ in chunk:
+                results.setdefault(key, BatchResult(key, error=e))
+        return results
@@ -0,0 +1,98 @@
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, NamedTuple, Optional
+
+import httplib2
+
+
+class DriveClient(NamedTuple):
+    http: object  # google_auth_httplib2.AuthorizedHttp
+    service: object  # Drive service whose requests default to http
+
+
+class DriveClientPool:
+    """
+    Fixed-size pool of Drive clients, each with its own authorized httplib2
+    transport, all sharing one set of credentials.
+    httplib2 connections are not thread-safe, so a client is checked out by one
+    thread at a time and checked back in when its call finishes. Clients are
+    created lazily up to `size`; further checkouts wait for one to be returned.
+    """
+
+    # After these the transport's connection state cannot be trusted
+    CONNECTION_ERRORS = (socket.error, ssl.SSLError, httplib2.HttpLib2Error)
+
+    def __init__(
+        self, factory: Callable[[], DriveClient], size: int = 8, timeout: float = 60
+    ):
+        self.factory = factory
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._available = threading.Condition()
+
+    def checkout(self, timeout: Optional[float] = None) -> DriveClient:
+        """
+        Returns an idle client, creating one if the pool is not yet full.
+        Raises TimeoutError if none becomes available within timeout seconds.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._available:
+            self._checkouts += 1
+            start = time.monotonic()
+            while not self._idle and self._created >= self.size:
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No Drive client available after {timeout:.1f}s "
+                        f"(pool size {self.size})"
+                    )
+                self._available.wait(remaining)
+            self._wait_seconds += time.monotonic() - start
+            if self._idle:
+                # Most recently used first, so its connection is likely still open
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self.factory()
+        except Exception:
+            self.checkin(None, discard=True)
+            raise
+
+    def checkin(self, client: Optional[DriveClient], discard: bool = False):
+        """Returns a client to the pool; a discarded client is rebuilt on demand."""
+        with self._available:
+            if discard:
+                self._created -= 1
+            else:
+                self._idle.append(client)
+            self._available.notify()
+
+    @contextmanager
+    def client(self, timeout: Optional[float] = None):
+        """Checks a client out for the duration of the block."""
+        client = self.checkout(timeout)
+        discard = False
+        try:
+            yield client
+        except self.CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.checkin(client, discard=discard)
+
+    def stats(self) -> dict:
+        with self._available:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "wait_seconds": self._wait_seconds,
+            }
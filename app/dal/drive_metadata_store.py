@@ -0,0 +1,182 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class DriveMetadataStore:
+    """
+    Local SQLite mirror of Drive file metadata for the folders the app works with.
+    A folder is "tracked" once its full child listing has been recorded; from then
+    on change notifications keep it up to date, and listings younger than max_age
+    seconds can be answered locally without calling Drive.
+    """
+
+    FILE_FIELDS = (
+        "id, name, mimeType, md5Checksum, modifiedTime, createdTime, parents, "
+        "thumbnailLink, webContentLink"
+    )
+    FIELDS = f"files({FILE_FIELDS})"
+    SCHEMA_VERSION = 2
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id TEXT NOT NULL,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mime_type TEXT,
+            md5 TEXT,
+            modified_time TEXT,
+            created_time TEXT,
+            thumbnail_link TEXT,
+            web_content_link TEXT,
+            PRIMARY KEY (id, parent)
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_parent ON files (parent);
+        CREATE INDEX IF NOT EXISTS idx_files_name ON files (name);
+        CREATE TABLE IF NOT EXISTS folders (
+            id TEXT PRIMARY KEY,
+            synced_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = "drive_metadata.sqlite3", max_age: float = 300):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # The mirror can always be rebuilt from Drive, so an old layout is dropped
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != (
+                self.SCHEMA_VERSION
+            ):
+                self._conn.execute("DROP TABLE IF EXISTS files")
+                self._conn.execute("DROP TABLE IF EXISTS folders")
+                self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def covers(cls, fields: str) -> bool:
+        """Whether listings from the store hold every file field in fields."""
+        match = re.search(r"files\((.*)\)", fields)
+        requested = match.group(1) if match else fields
+        held = {f.strip() for f in cls.FILE_FIELDS.split(",")}
+        return all(f.strip() in held for f in requested.split(",") if f.strip())
+
+    def is_fresh(self, folder_id: str, max_age: Optional[float] = None) -> bool:
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at FROM folders WHERE id = ?", (folder_id,)
+            ).fetchone()
+        return row is not None and time.time() - row["synced_at"] < max_age
+
+    def tracked_folders(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM folders").fetchall()
+        return [row["id"] for row in rows]
+
+    def list_children(self, folder_id: str) -> List[dict]:
+        """Children of a folder in Drive API format, ordered by name."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM files WHERE parent = ? ORDER BY name", (folder_id,)
+            ).fetchall()
+        return [self._to_file(row) for row in rows]
+
+    def find_by_base_names(
+        self, folder_id: str, base_names: Iterable[str]
+    ) -> Dict[str, List[dict]]:
+        """
+        Children of a folder whose name without extension is one of base_names,
+        grouped by base name. Each lookup is a range scan of the name index
+        ("base" and "base.*") instead of a read of the whole folder.
+        """
+        found = {}
+        with self._lock:
+            for base_name in set(base_names):
+                rows = self._conn.execute(
+                    "SELECT * FROM files WHERE parent = ? AND "
+                    "(name = ? OR (name >= ? AND name < ?))",
+                    (folder_id, base_name, base_name + ".", base_name + "/"),
+                ).fetchall()
+                files = [
+                    self._to_file(row)
+                    for row in rows
+                    if os.path.splitext(row["name"])[0] == base_name
+                ]
+                if files:
+                    found[base_name] = files
+        return found
+
+    def replace_folder(self, folder_id: str, files: Iterable[dict]):
+        """Record the complete child listing of a folder and mark it as synced now."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE parent = ?", (folder_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(f, folder_id) for f in files],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?)", (folder_id, time.time())
+            )
+
+    def upsert_file(self, file: dict):
+        """
+        Apply a single file's latest metadata (e.g. from a change notification).
+        Only rows under tracked folders are kept; trashed files are removed.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE id = ?", (file["id"],))
+            if file.get("trashed"):
+                return
+            for parent in file.get("parents", []):
+                tracked = self._conn.execute(
+                    "SELECT 1 FROM folders WHERE id = ?", (parent,)
+                ).fetchone()
+                if tracked:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        self._to_row(file, parent),
+                    )
+
+    def remove_file(self, file_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    @staticmethod
+    def _to_row(file: dict, parent: str):
+        return (
+            file["id"],
+            parent,
+            file["name"],
+            file.get("mimeType"),
+            file.get("md5Checksum"),
+            file.get("modifiedTime"),
+            file.get("createdTime"),
+            file.get("thumbnailLink"),
+            file.get("webContentLink"),
+        )
+
+    @staticmethod
+    def _to_file(row) -> dict:
+        file = {
+            "id": row["id"],
+            "name": row["name"],
+            "mimeType": row["mime_type"],
+            "parents": [row["parent"]],
+        }
+        for key, column in (
+            ("md5Checksum", "md5"),
+            ("modifiedTime", "modified_time"),
+            ("createdTime", "created_time"),
+            ("thumbnailLink", "thumbnail_link"),
+            ("webContentLink", "web_content_link"),
+        ):
+            if row[column] is not None:
+                file[key] = row[column]
+        return file
@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from googleapiclient.errors import HttpError
+
+from dal.rate_limit import SlidingWindowCounter, TokenBucket
+
+
+class GoogleApiExecutor:
+    """
+    Shared execution layer for Google API calls.
+    Every call takes tokens from one bucket sized to the project's quota, so
+    bursts from concurrent requests queue up instead of tripping 429s for each
+    other. 429, rate-limit 403s and 5xx responses are retried with jittered
+    exponential backoff until the per-call deadline runs out.
+    """
+
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+    RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+    def __init__(
+        self,
+        requests_per_second: float = 10,
+        burst: Optional[float] = None,
+        max_retries: int = 5,
+        deadline: float = 120,
+        base_delay: float = 1,
+        max_delay: float = 32,
+    ):
+        self.bucket = TokenBucket(requests_per_second, burst or requests_per_second)
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._usage = SlidingWindowCounter(60)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "throttle_wait_seconds": 0.0,
+        }
+
+    def execute(self, request, deadline: Optional[float] = None, **kwargs):
+        """Execute a googleapiclient HttpRequest through the shared limiter."""
+        return self.call(lambda: request.execute(**kwargs), deadline=deadline)
+
+    def call(
+        self,
+        fn: Callable,
+        cost: float = 1,
+        deadline: Optional[float] = None,
+        idempotent: bool = True,
+    ):
+        """
+        Run fn() (which performs `cost` API calls) with pacing and retries.
+        Non-idempotent calls, such as batches containing copies, are only retried
+        on rate-limit errors, which Google rejects before doing any work.
+        """
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            remaining = expires_at - time.monotonic()
+            try:
+                waited = self.bucket.acquire(cost, timeout=max(0.0, remaining))
+            except TimeoutError:
+                self._count("failures")
+                raise
+            self._count("throttle_wait_seconds", waited)
+            self._count("calls", cost)
+            self._usage.add(cost)
+            for counter in getattr(self._local, "counters", ()):
+                counter["calls"] += cost
+            try:
+                return fn()
+            except HttpError as e:
+                rate_limited = self.is_rate_limit_error(e)
+                if rate_limited:
+                    self._count("rate_limited")
+                retryable = rate_limited or (
+                    idempotent and e.resp.status in self.RETRYABLE_STATUSES
+                )
+                delay = self.backoff_delay(attempt, e)
+                if (
+                    not retryable
+                    or attempt >= self.max_retries
+                    or time.monotonic() + delay > expires_at
+                ):
+                    self._count("failures")
+                    raise
+                print(
+                    f"Google API error {e.resp.status}, retrying in {delay:.1f}s "
+                    f"(retry {attempt + 1}/{self.max_retries})"
+                )
+                self._count("retries")
+                time.sleep(delay)
+                attempt += 1
+
+    @contextmanager
+    def count_calls(self):
+        """
+        Counts the API calls (including retries and calls inside batches) made
+        by the current thread while the context is active.
+        """
+        counter = {"calls": 0}
+        counters = self._local.__dict__.setdefault("counters", [])
+        counters.append(counter)
+        try:
+            yield counter
+        finally:
+            counters.remove(counter)
+
+    @classmethod
+    def is_rate_limit_error(cls, error) -> bool:
+        if not isinstance(error, HttpError):
+            return False
+        if error.resp.status == 429:
+            return True
+        if error.resp.status == 403:
+            details = (
+                error.error_details if isinstance(error.error_details, list) else []
+            )
+            reasons = {d.get("reason") for d in details if isinstance(d, dict)}
+            return bool(reasons & cls.RATE_LIMIT_REASONS)
+        return False
+
+    def backoff_delay(self, attempt: int, error: Optional[HttpError] = None) -> float:
+        retry_after = error.resp.get("retry-after") if error is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent retries from re-colliding
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["calls_last_minute"] = self._usage.value()
+        stats["quota_per_minute"] = self.bucket.rate * 60
+        stats["quota_used"] = stats["calls_last_minute"] / stats["quota_per_minute"]
+        return stats
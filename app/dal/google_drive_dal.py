@@ -1,154 +1,435 @@
+import hashlib
 import json
 import os
 import re
 import time
-from typing import List, Optional, Tuple
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import google_auth_httplib2
+import httplib2
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 
+from dal.drive_batch import DriveBatch
+from dal.drive_client_pool import DriveClient, DriveClientPool
+from dal.drive_downloader import DriveDownloader
+from dal.drive_metadata_store import DriveMetadataStore
+from dal.google_api_executor import GoogleApiExecutor
+from dal.image_cache import ImageCache
+
+
+class _HashingWriter:
+    """File wrapper that computes the MD5 of everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data)
+        return self.f.write(data)
+
 
 class GoogleDriveDAL:
     SCOPES = ["https://www.googleapis.com/auth/drive"]
     IMAGES_DIR = "temp_images"
+    PAGE_SIZE = 1000
+    MAX_PAGE_SIZE = 1000  # Drive API upper bound for files.list pageSize
+    DATE_GROUP_PATTERN = re.compile(r"\d{2}\.\d{2}\.\d{2}-\d+")
+    HTTP_TIMEOUT = 60  # seconds per socket operation
+    PARENTS_PER_QUERY = 40  # keeps combined "in parents" queries well under URL limits
 
-    def __init__(self, service_account_file: str):
-        if not os.path.exists(self.IMAGES_DIR):
-            os.makedirs(self.IMAGES_DIR)
+    def __init__(
+        self,
+        service_account_file: str,
+        download_workers: int = 8,
+        image_cache_max_bytes: int = 2 * 1024**3,
+        executor: Optional[GoogleApiExecutor] = None,
+        metadata_store: Optional[DriveMetadataStore] = None,
+        pool_size: int = 16,
+    ):
+        self.image_cache = ImageCache(self.IMAGES_DIR, max_bytes=image_cache_max_bytes)
+        self.executor = executor or GoogleApiExecutor()
+        self.metadata_store = metadata_store
         self.creds = service_account.Credentials.from_service_account_file(
             service_account_file, scopes=self.SCOPES
         )
-        self.service = build("drive", "v3", credentials=self.creds)
+        self.client_pool = DriveClientPool(self.build_client, size=pool_size)
+        # Only used to build requests; they are sent on pooled transports
+        self.service = self.build_client().service
         self.service_account_email = self._get_service_account_email(
             service_account_file
         )
+        self.downloader = DriveDownloader(self, max_workers=download_workers)
 
-    def list_images_in_folder(self, folder_id: str):
-        response = (
-            self.service.files()
-            .list(
-                q=f"'{folder_id}' in parents and mimeType contains 'image/'",
-                fields="files(id, name, mimeType, webContentLink, thumbnailLink)",
-            )
-            .execute()
+    def build_client(self) -> DriveClient:
+        """Build a Drive service on its own authorized transport with a socket timeout."""
+        http = google_auth_httplib2.AuthorizedHttp(
+            self.creds, http=httplib2.Http(timeout=self.HTTP_TIMEOUT)
         )
-        return response.get("files", [])
+        return DriveClient(http, build("drive", "v3", http=http, cache_discovery=False))
 
-    def list_images_with_grouping(self, folder_id: str, retry_count=0, max_retries=5):
+    def execute(self, request, deadline: Optional[float] = None, **kwargs):
         """
-        Recursively lists all images in the given folder, including images in subfolders
-        with names matching the date-group pattern. Adds group info to each image.
-        Handles rate limiting with exponential backoff.
+        Execute an API request through the shared rate limiter and retry layer.
+        Each attempt runs on a transport checked out from the client pool, so
+        the DAL can be used from any number of threads.
         """
-        import re
 
-        date_group_pattern = re.compile(r"\d{2}\.\d{2}\.\d{2}-\d+")
-        images = []
+        def send():
+            with self.client_pool.client() as client:
+                return request.execute(http=client.http, **kwargs)
 
-        try:
-            response = (
-                self.service.files()
-                .list(
-                    q=f"'{folder_id}' in parents and trashed = false",
-                    fields="files(id, name, mimeType, webContentLink, thumbnailLink)",
+        return self.executor.call(send, deadline=deadline)
+
+    def iter_files(
+        self,
+        query: str,
+        fields: str = "files(id, name, mimeType)",
+        page_size: int = PAGE_SIZE,
+    ) -> Iterator[dict]:
+        """
+        Yields every file matching the query, following nextPageToken so that
+        folders larger than a single page are listed completely.
+        Files are yielded as each page arrives, so callers never need to hold
+        the whole listing in memory.
+        """
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        if "nextPageToken" not in fields:
+            fields = f"nextPageToken, {fields}"
+
+        page_token = None
+        while True:
+            response = self.execute(
+                self.service.files().list(
+                    q=query,
+                    fields=fields,
+                    pageSize=page_size,
+                    pageToken=page_token,
                 )
-                .execute()
             )
-        except HttpError as e:
-            if e.resp.status == 429 and retry_count < max_retries:
-                wait_time = 2**retry_count
-                print(
-                    f"Rate limit hit (429). Sleeping for {wait_time} seconds... (retry {retry_count+1}/{max_retries})"
-                )
-                time.sleep(wait_time)
-                return self.list_images_with_grouping(
-                    folder_id, retry_count=retry_count + 1, max_retries=max_retries
+            yield from response.get("files", [])
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+    def iter_children(
+        self,
+        folder_id: str,
+        fields: str = "files(id, name, mimeType)",
+        page_size: int = PAGE_SIZE,
+        max_age: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """
+        Yields every non-trashed child (files and folders) of folder_id.
+        With a metadata store, folders synced within its freshness bound (or
+        max_age seconds, if given; 0 always asks Drive) are answered locally,
+        and listings fetched from Drive are recorded.
+        Fields the store does not hold are always listed from Drive.
+        """
+        query = f"'{folder_id}' in parents and trashed = false"
+        store = self.metadata_store
+        if store is None or not store.covers(fields):
+            yield from self.iter_files(query, fields=fields, page_size=page_size)
+            return
+        if store.is_fresh(folder_id, max_age):
+            yield from store.list_children(folder_id)
+            return
+
+        children = []
+        for f in self.iter_files(query, fields=store.FIELDS, page_size=page_size):
+            children.append(f)
+            yield f
+        # Only a fully consumed listing is a complete picture of the folder
+        store.replace_folder(folder_id, children)
+
+    def find_by_base_names(self, folder_id: str, base_names) -> Dict[str, List[dict]]:
+        """
+        Non-folder files in folder_id whose name without extension is one of
+        base_names, grouped by base name. A folder the metadata store holds
+        fresh is answered from its name index; otherwise the folder is listed
+        (and recorded in the store).
+        """
+        wanted = set(base_names)
+        store = self.metadata_store
+        if store is not None and store.is_fresh(folder_id):
+            found = store.find_by_base_names(folder_id, wanted)
+            return {
+                base_name: [
+                    f
+                    for f in files
+                    if f["mimeType"] != "application/vnd.google-apps.folder"
+                ]
+                for base_name, files in found.items()
+            }
+
+        found = defaultdict(list)
+        for file in self.iter_files_in_folder(
+            folder_id, fields="files(id, name, mimeType, parents)"
+        ):
+            base_name, _ = os.path.splitext(file["name"])
+            if base_name in wanted:
+                found[base_name].append(file)
+        return dict(found)
+
+    def record_file(self, file: dict):
+        """Apply file metadata returned by a mutation to the metadata store."""
+        if self.metadata_store is not None:
+            self.metadata_store.upsert_file(file)
+
+    def refresh_folders(self, folder_ids):
+        """Re-list folders from Drive so the metadata store matches Drive again."""
+        store = self.metadata_store
+        if store is None:
+            return
+        for folder_id in folder_ids:
+            try:
+                children = list(
+                    self.iter_files(
+                        f"'{folder_id}' in parents and trashed = false",
+                        fields=store.FIELDS,
+                    )
                 )
-            else:
-                print(f"Google API error: {e}")
-                raise
+                store.replace_folder(folder_id, children)
+            except Exception as e:
+                print(f"Failed to refresh metadata for folder {folder_id}: {e}")
 
-        files = response.get("files", [])
+    def iter_images_in_folder(self, folder_id: str, page_size: int = PAGE_SIZE):
+        return self.iter_files(
+            f"'{folder_id}' in parents and mimeType contains 'image/'",
+            fields="files(id, name, mimeType, md5Checksum, modifiedTime, webContentLink, thumbnailLink)",
+            page_size=page_size,
+        )
+
+    def list_images_in_folder(self, folder_id: str):
+        return list(self.iter_images_in_folder(folder_id))
 
-        for f in files:
+    def iter_images_with_grouping(self, folder_id: str, page_size: int = PAGE_SIZE):
+        """
+        Yields all images in the given folder, including images in subfolders
+        with names matching the date-group pattern. Adds group info to each image.
+        Subfolders are listed together with combined "'a' in parents or 'b' in parents"
+        queries, so the number of requests barely grows with the number of groups.
+        """
+        images_fields = "files(id, name, mimeType, md5Checksum, modifiedTime, createdTime, parents, webContentLink, thumbnailLink)"
+        group_folders = {}
+        for f in self.iter_children(
+            folder_id, fields=images_fields, page_size=page_size
+        ):
             if f["mimeType"].startswith("image/"):
-                images.append({**f, "group": None})
+                yield {**f, "group": None}
             elif f["mimeType"] == "application/vnd.google-apps.folder":
-                if date_group_pattern.fullmatch(f["name"]):
-                    try:
-                        sub_response = (
-                            self.service.files()
-                            .list(
-                                q=f"'{f['id']}' in parents and mimeType contains 'image/' and trashed = false",
-                                fields="files(id, name, mimeType, webContentLink, thumbnailLink)",
-                            )
-                            .execute()
-                        )
-                        sub_images = sub_response.get("files", [])
-                        for img in sub_images:
-                            images.append({**img, "group": f["name"]})
-                    except HttpError as e:
-                        if e.resp.status == 429 and retry_count < max_retries:
-                            wait_time = 2**retry_count
-                            print(
-                                f"Subfolder rate limit hit (429). Sleeping for {wait_time} seconds... (retry {retry_count+1}/{max_retries})"
-                            )
-                            time.sleep(wait_time)
-                            # Retry this subfolder only
-                            return self.list_images_with_grouping(
-                                folder_id,
-                                retry_count=retry_count + 1,
-                                max_retries=max_retries,
-                            )
-                        else:
-                            print(f"Google API error in subfolder: {e}")
-                            raise
-        return images
-
-    def download_file(self, file_id: str, file_name: str = None) -> str:
-        """
-        Downloads a file from Google Drive to the local IMAGES_DIR, avoiding re-downloads.
-        If file_name is not provided, it is fetched from Drive metadata.
-        Returns the local filename, or None if download fails.
-        """
-        # If file_name is not given, get it from Drive API
-        if file_name is None:
-            try:
-                file_metadata = (
-                    self.service.files().get(fileId=file_id, fields="name").execute()
+                if self.DATE_GROUP_PATTERN.fullmatch(f["name"]):
+                    group_folders[f["id"]] = f["name"]
+
+        store = self.metadata_store
+        if store is not None and not store.covers(images_fields):
+            store = None
+        stale_ids = []
+        for sub_id, group in group_folders.items():
+            if store is not None and store.is_fresh(sub_id):
+                for img in store.list_children(sub_id):
+                    if img["mimeType"].startswith("image/"):
+                        yield {**img, "group": group}
+            else:
+                stale_ids.append(sub_id)
+
+        for start in range(0, len(stale_ids), self.PARENTS_PER_QUERY):
+            chunk = stale_ids[start : start + self.PARENTS_PER_QUERY]
+            parents_clause = " or ".join(f"'{sub_id}' in parents" for sub_id in chunk)
+            children = {sub_id: [] for sub_id in chunk}
+            for f in self.iter_files(
+                f"({parents_clause}) and trashed = false",
+                fields=images_fields,
+                page_size=page_size,
+            ):
+                parent = next((p for p in f.get("parents", []) if p in children), None)
+                if parent is None:
+                    continue
+                if store is not None:
+                    children[parent].append(f)
+                if f["mimeType"].startswith("image/"):
+                    yield {**f, "group": group_folders[parent]}
+            if store is not None:
+                for sub_id, files in children.items():
+                    store.replace_folder(sub_id, files)
+
+    def list_images_with_grouping(self, folder_id: str):
+        """
+        Lists all images in the given folder, including images in subfolders
+        with names matching the date-group pattern. Adds group info to each image.
+        Rate limiting is retried per request by the shared GoogleApiExecutor.
+        """
+        return list(self.iter_images_with_grouping(folder_id))
+
+    def new_batch(self, batch_size: int = DriveBatch.MAX_BATCH_SIZE) -> DriveBatch:
+        """Return a DriveBatch for grouping mutations into batch HTTP requests."""
+        return DriveBatch(
+            self.service,
+            self.executor,
+            batch_size=batch_size,
+            client_pool=self.client_pool,
+        )
+
+    def get_start_page_token(self) -> str:
+        """Return the current Changes API cursor for the service account's Drive."""
+        response = self.execute(self.service.changes().getStartPageToken())
+        return response["startPageToken"]
+
+    def list_changes(
+        self,
+        page_token: str,
+        fields: str = f"changes(fileId, removed, file({DriveMetadataStore.FILE_FIELDS}, trashed))",
+        page_size: int = PAGE_SIZE,
+    ) -> Tuple[List[dict], str]:
+        """
+        Returns every change recorded since page_token, following nextPageToken,
+        together with the newStartPageToken to store for the next call.
+        Changes are also applied to the metadata store, if there is one.
+        """
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        fields = f"nextPageToken, newStartPageToken, {fields}"
+
+        changes = []
+        while True:
+            response = self.execute(
+                self.service.changes().list(
+                    pageToken=page_token, fields=fields, pageSize=page_size
                 )
+            )
+            changes.extend(response.get("changes", []))
+            if self.metadata_store is not None:
+                for change in response.get("changes", []):
+                    if change.get("removed"):
+                        self.metadata_store.remove_file(change["fileId"])
+                    elif change.get("file"):
+                        self.metadata_store.upsert_file(change["file"])
+            if "newStartPageToken" in response:
+                return changes, response["newStartPageToken"]
+            page_token = response["nextPageToken"]
+
+    def watch_file(
+        self,
+        file_id: str,
+        channel_id: str,
+        address: str,
+        token: Optional[str] = None,
+        ttl: Optional[int] = None,
+    ) -> dict:
+        """
+        Open a push-notification channel for a file or folder (files.watch).
+        ttl is the requested lifetime in seconds; Drive may grant less.
+        Returns the channel, including resourceId and expiration (ms since epoch).
+        """
+        body = {"id": channel_id, "type": "web_hook", "address": address}
+        if token:
+            body["token"] = token
+        if ttl:
+            body["expiration"] = int((time.time() + ttl) * 1000)
+        return self.execute(self.service.files().watch(fileId=file_id, body=body))
+
+    def stop_channel(self, channel_id: str, resource_id: str):
+        """Stop notifications for a channel opened with watch_file."""
+        self.execute(
+            self.service.channels().stop(
+                body={"id": channel_id, "resourceId": resource_id}
+            )
+        )
+
+    def image_cache_key(self, file: dict) -> str:
+        """Image cache key download_file uses for a listed file."""
+        version = file.get("md5Checksum") or file.get("modifiedTime") or ""
+        return self.image_cache.make_key(file["id"], file["name"], version)
+
+    def download_files(self, files):
+        """
+        Downloads files concurrently (see DriveDownloader.download_all).
+        Returns (file, local_filename, seconds) tuples in input order.
+        """
+        return self.downloader.download_all(files)
+
+    def download_file(
+        self,
+        file_id: str,
+        file_name: str = None,
+        version: str = None,
+        md5_checksum: str = None,
+    ) -> str:
+        """
+        Downloads a file from Google Drive into the image cache, avoiding re-downloads.
+        The cache key is the file ID plus its version (md5Checksum or modifiedTime);
+        if file_name or version is not provided, they are fetched from Drive metadata.
+        When md5_checksum is known, a download whose content does not match it
+        is discarded instead of being cached.
+        Returns the cache filename (relative to IMAGES_DIR), or None if download fails.
+        """
+        # If file_name or version is not given, get them from Drive API
+        if file_name is None or version is None:
+            try:
+                file_metadata = self.get_file_metadata(file_id)
                 file_name = file_metadata["name"]
+                md5_checksum = file_metadata.get("md5Checksum")
+                version = md5_checksum or file_metadata.get("modifiedTime", "")
             except Exception as e:
                 print(f"Failed to fetch metadata for file {file_id}: {e}")
                 return None
 
-        # Sanitize the filename
-        safe_name = re.sub(r"[^a-zA-Z0-9_.-]", "_", file_name)
-        file_path = os.path.join(self.IMAGES_DIR, safe_name)
+        key = self.image_cache.make_key(file_id, file_name, version)
+        if self.image_cache.get(key):
+            print(f"File {file_name} already cached as {key}, skipping download")
+            return key
 
-        # Check if file already exists
-        if os.path.exists(file_path):
-            print(f"File {safe_name} already exists, skipping download")
-            return safe_name
-
-        print(f"Downloading {safe_name}...")
+        print(f"Downloading {file_name} as {key}...")
 
+        temp_path = self.image_cache.temp_path(key)
         try:
-            request = self.service.files().get_media(fileId=file_id)
-            with open(file_path, "wb") as f:
-                downloader = MediaIoBaseDownload(f, request)
+            # Chunks are fetched with the request's own transport, so the
+            # client stays checked out for the whole download
+            with self.client_pool.client() as client, open(temp_path, "wb") as f:
+                writer = _HashingWriter(f)
+                request = client.service.files().get_media(fileId=file_id)
+                downloader = MediaIoBaseDownload(writer, request)
                 done = False
                 while not done:
-                    status, done = downloader.next_chunk()
+                    status, done = self.executor.call(downloader.next_chunk)
                     if status:
                         print(f"Download {int(status.progress() * 100)}%.")
-            print(f"Downloaded {safe_name}")
-            return safe_name
+            digest = writer.md5.hexdigest()
+            if md5_checksum and digest != md5_checksum:
+                raise ValueError(
+                    f"content MD5 {digest} does not match md5Checksum {md5_checksum}"
+                )
+            self.image_cache.put(key, temp_path)
+            print(f"Downloaded {key}")
+            return key
         except Exception as e:
-            print(f"Failed to download file {file_id} as {safe_name}: {e}")
+            print(f"Failed to download file {file_id} as {key}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+    def get_file_metadata(
+        self, file_id: str, fields: str = "name, md5Checksum, modifiedTime"
+    ) -> dict:
+        return self.execute(self.service.files().get(fileId=file_id, fields=fields))
+
+    def read_file(self, file_id: str, metadata: dict = None) -> Optional[bytes]:
+        """
+        Returns the content of a Drive file, served from the image cache when possible.
+        :param metadata: The file's get_file_metadata result, if already fetched.
+        """
+        if metadata:
+            md5_checksum = metadata.get("md5Checksum")
+            version = md5_checksum or metadata.get("modifiedTime", "")
+            key = self.download_file(file_id, metadata["name"], version, md5_checksum)
+        else:
+            key = self.download_file(file_id)
+        if not key:
             return None
+        with open(self.image_cache.path(key), "rb") as f:
+            return f.read()
 
     @staticmethod
     def extract_folder_id(url: str) -> str:
@@ -163,10 +444,10 @@ class GoogleDriveDAL:
             return json.load(f)["client_email"]
 
     def check_folder_permissions(self, folder_id: str, folder_label: str = "") -> bool:
-        permissions = (
-            self.service.permissions()
-            .list(fileId=folder_id, fields="permissions(emailAddress,role,type)")
-            .execute()
+        permissions = self.execute(
+            self.service.permissions().list(
+                fileId=folder_id, fields="permissions(emailAddress,role,type)"
+            )
         )
         found = False
         for perm in permissions.get("permissions", []):
@@ -175,18 +456,36 @@ class GoogleDriveDAL:
                 found = True
         return found
 
+    def iter_files_in_folder(
+        self,
+        folder_id: str,
+        fields: str = "files(id, name, mimeType)",
+        page_size: int = PAGE_SIZE,
+        max_age: Optional[float] = None,
+    ) -> Iterator[dict]:
+        """
+        Yield the (non-folder) files in the given folder ID, page by page.
+        max_age is passed to iter_children when the metadata store is used.
+        """
+        if self.metadata_store is not None and self.metadata_store.covers(fields):
+            return (
+                f
+                for f in self.iter_children(
+                    folder_id, fields=fields, page_size=page_size, max_age=max_age
+                )
+                if f["mimeType"] != "application/vnd.google-apps.folder"
+            )
+        return self.iter_files(
+            f"'{folder_id}' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'",
+            fields=fields,
+            page_size=page_size,
+        )
+
     def list_files_in_folder(
         self, folder_id: str, fields: str = "files(id, name, mimeType)"
     ):
         """Return a list of files in the given folder ID."""
-        return (
-            self.service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'",
-                fields=fields,
-            )
-            .execute()
-        ).get("files", [])
+        return list(self.iter_files_in_folder(folder_id, fields=fields))
 
     def get_subfolder_id(self, parent_id: str, folder_name: str) -> Optional[str]:
         query = (
@@ -194,7 +493,9 @@ class GoogleDriveDAL:
             f"name = '{folder_name}' and "
             f"mimeType = 'application/vnd.google-apps.folder' and trashed = false"
         )
-        results = self.service.files().list(q=query, fields="files(id, name)").execute()
+        results = self.execute(
+            self.service.files().list(q=query, fields="files(id, name)")
+        )
         files = results.get("files", [])
         return files[0]["id"] if files else None
 
@@ -203,6 +504,7 @@ class GoogleDriveDAL:
             f"'{active_clienti_folder_id}' in parents and "
             f"mimeType = 'application/vnd.google-apps.folder' and trashed = false"
         )
-        results = self.service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        return [(f["name"], f["id"]) for f in files]
+        return [
+            (f["name"], f["id"])
+            for f in self.iter_files(query, fields="files(id, name)")
+        ]
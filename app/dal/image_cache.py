@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class ImageCache:
+    """
+    On-disk cache for files downloaded from Drive.
+    Entries are keyed by Drive file ID plus a content version (md5Checksum, or
+    modifiedTime when no checksum is available), so a re-uploaded file gets a new
+    key and same-named files never collide. Once the cache grows past max_bytes,
+    least recently used entries are evicted, except keys pinned by an active
+    listing. Bytes of files derived from an entry (see add_related_bytes) count
+    towards its size. Sizes and recency are persisted in an index file so they
+    survive restarts.
+    """
+
+    INDEX_FILE = ".cache_index.json"
+    INDEX_SAVE_INTERVAL = 30  # seconds between index writes caused by hits alone
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self._last_index_save = 0.0
+        self._evict_callbacks: List[Callable[[str], None]] = []
+        self._pins: Dict[str, int] = {}  # key -> number of active pins
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(file_id: str, file_name: str, version: str) -> str:
+        """Build the cache filename for a given Drive file version."""
+        ext = re.sub(r"[^a-z0-9.]", "", os.path.splitext(file_name)[1].lower())
+        version_hash = hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+        safe_id = re.sub(r"[^a-zA-Z0-9_-]", "_", file_id)
+        return f"{safe_id}-{version_hash}{ext}"
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def on_evict(self, callback: Callable[[str], None]):
+        """Register a callback invoked with the key of every evicted entry."""
+        self._evict_callbacks.append(callback)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the key if it is cached (counting a hit), otherwise None."""
+        with self._lock:
+            if key in self._entries and os.path.exists(self.path(key)):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._save_index(force=False)
+                return key
+            if key in self._entries:
+                # File was removed behind our back
+                self._total_bytes -= self._entries.pop(key)
+            self.misses += 1
+            return None
+
+    def touch(self, key: str) -> bool:
+        """Mark an entry as recently used without counting a hit."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    @contextmanager
+    def pinned(self, keys: Iterable[str]):
+        """
+        Keep keys from being evicted inside the block, e.g. while a listing that
+        links to them is downloaded. Keys need not be cached yet.
+        """
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for key in keys:
+                    count = self._pins.pop(key) - 1
+                    if count:
+                        self._pins[key] = count
+
+    def size_of(self, keys: Iterable[str]) -> int:
+        """Total bytes of the given cached entries."""
+        with self._lock:
+            return sum(self._entries.get(key, 0) for key in keys)
+
+    def add_related_bytes(self, key: str, size: int) -> bool:
+        """
+        Count a file derived from an entry (e.g. a thumbnail) towards the budget.
+        Returns False when the entry is no longer cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries[key] += size
+            self._total_bytes += size
+            self._evict()
+            return True
+
+    def temp_path(self, key: str) -> str:
+        """A unique path to download into before calling put()."""
+        return self.path(f".{key}.{uuid.uuid4().hex}.part")
+
+    def put(self, key: str, temp_path: str) -> str:
+        """Move a completed download into the cache and evict as needed."""
+        os.replace(temp_path, self.path(key))
+        size = os.path.getsize(self.path(key))
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+            self._save_index(force=True)
+        return key
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the budget
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in list(self._entries)[:-1]:
+            if self._total_bytes <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            size = self._entries.pop(key)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            for callback in self._evict_callbacks:
+                try:
+                    callback(key)
+                except Exception as e:
+                    print(f"Image cache eviction callback failed for {key}: {e}")
+
+    def _load_index(self):
+        index_path = self.path(self.INDEX_FILE)
+        entries = []
+        try:
+            with open(index_path) as f:
+                entries = json.load(f).get("entries", [])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Failed to load image cache index, rebuilding: {e}")
+
+        known = set()
+        for key, size in entries:
+            if os.path.exists(self.path(key)):
+                self._entries[key] = size
+                known.add(key)
+
+        # Adopt files left without an index entry as the oldest ones, so they
+        # count towards the budget and are evicted first
+        for name in os.listdir(self.directory):
+            if name.startswith(".") or name in known:
+                continue
+            file_path = self.path(name)
+            if os.path.isfile(file_path):
+                self._entries[name] = os.path.getsize(file_path)
+                self._entries.move_to_end(name, last=False)
+
+        self._total_bytes = sum(self._entries.values())
+        self._evict()
+        self._save_index(force=True)
+
+    def _save_index(self, force: bool):
+        now = time.monotonic()
+        if not force and now - self._last_index_save < self.INDEX_SAVE_INTERVAL:
+            return
+        index_path = self.path(self.INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": list(self._entries.items())}, f)
+        os.replace(tmp_path, index_path)
+        self._last_index_save = now
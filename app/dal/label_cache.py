@@ -0,0 +1,86 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class LabelCache:
+    """
+    Persistent cache of Cloud Vision labels keyed by image content hash (the
+    Drive md5Checksum, which is the MD5 of the file content) and the number of
+    labels requested. The same photo captioned again needs neither a download
+    nor a Vision call.
+    The file records SCHEMA_VERSION; a file written by another version is
+    cleared on open instead of being misread.
+    """
+
+    SCHEMA_VERSION = 1
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS labels (
+            content_hash TEXT NOT NULL,
+            max_results INTEGER NOT NULL,
+            labels TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (content_hash, max_results)
+        );
+    """
+
+    def __init__(self, path: str = "vision_labels.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                if version:
+                    print(
+                        f"Label cache {path} has schema version {version}, "
+                        f"expected {self.SCHEMA_VERSION}; clearing it"
+                    )
+                self._conn.execute("DROP TABLE IF EXISTS labels")
+                self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._conn.executescript(self.SCHEMA)
+
+    def get(self, content_hash: str, max_results: int) -> Optional[List[str]]:
+        return self.get_many([content_hash], max_results).get(content_hash)
+
+    def get_many(
+        self, content_hashes: Iterable[str], max_results: int
+    ) -> Dict[str, List[str]]:
+        """Cached labels for the hashes that have them."""
+        content_hashes = list(content_hashes)
+        found = {}
+        with self._lock:
+            for content_hash in content_hashes:
+                row = self._conn.execute(
+                    "SELECT labels FROM labels WHERE content_hash = ? AND max_results = ?",
+                    (content_hash, max_results),
+                ).fetchone()
+                if row is not None:
+                    found[content_hash] = json.loads(row[0])
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(content_hashes) - len(found)
+        return found
+
+    def put(self, content_hash: str, max_results: int, labels: List[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?)",
+                (content_hash, max_results, json.dumps(labels), time.time()),
+            )
+            self._counters["stores"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = self._conn.execute(
+                "SELECT COUNT(*) FROM labels"
+            ).fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["schema_version"] = self.SCHEMA_VERSION
+        return stats
@@ -0,0 +1,282 @@
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+from models.notion_projection import CONTENT_PAGE
+
+
+class NotionContentStore:
+    """
+    Local SQLite mirror of the Notion content database, indexed by status,
+    identifier and client relation.
+    Syncs are incremental: only pages whose last_edited_time is on or after the
+    newest one already mirrored are queried. Archived or deleted pages never
+    show up in such a query, so a full resync replaces the mirror once it is
+    older than full_sync_interval seconds.
+    Reads call ensure_fresh first, so results are never older than max_age.
+    Listeners are called with the pages whose status or caption changed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            id TEXT PRIMARY KEY,
+            identifier TEXT NOT NULL,
+            status TEXT,
+            caption TEXT,
+            image_description TEXT,
+            drive_url TEXT,
+            last_edited_time TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_pages_status ON pages (status);
+        CREATE INDEX IF NOT EXISTS idx_pages_identifier ON pages (identifier);
+        CREATE TABLE IF NOT EXISTS page_relations (
+            page_id TEXT NOT NULL,
+            property TEXT NOT NULL,
+            related_id TEXT NOT NULL,
+            PRIMARY KEY (page_id, property, related_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_page_relations_related
+            ON page_relations (property, related_id);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            database_id TEXT PRIMARY KEY,
+            cursor TEXT,
+            synced_at REAL NOT NULL,
+            full_synced_at REAL NOT NULL
+        );
+    """
+
+    # Relation attributes of CONTENT_PAGE stored in page_relations
+    RELATIONS = ("client_ids", "smm_ids")
+
+    def __init__(
+        self,
+        notion_dal,
+        database_id: str,
+        path: str = "notion_content.sqlite3",
+        max_age: float = 60,
+        full_sync_interval: float = 86400,
+    ):
+        self.notion_dal = notion_dal
+        self.database_id = database_id
+        self.path = path
+        self.max_age = max_age
+        self.full_sync_interval = full_sync_interval
+        self._lock = threading.Lock()
+        # Held for the duration of a sync so concurrent readers wait for it
+        self._sync_lock = threading.Lock()
+        self._counters = {"syncs": 0, "full_syncs": 0, "pages_synced": 0}
+        self._listeners: List[Callable[[List], None]] = []
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def add_listener(self, callback: Callable[[List], None]):
+        self._listeners.append(callback)
+
+    def age(self) -> Optional[float]:
+        """Seconds since the last successful sync, None if never synced."""
+        state = self._state()
+        return None if state is None else time.time() - state["synced_at"]
+
+    def ensure_fresh(self, max_age: Optional[float] = None):
+        """Sync unless the mirror was synced within max_age seconds."""
+        max_age = self.max_age if max_age is None else max_age
+        age = self.age()
+        if age is not None and age <= max_age:
+            return
+        with self._sync_lock:
+            # Another thread may have synced while this one waited
+            age = self.age()
+            if age is None or age > max_age:
+                self._sync()
+
+    def sync(self, full: bool = False) -> int:
+        """Pull changed pages from Notion. Returns the number of pages received."""
+        with self._sync_lock:
+            return self._sync(full)
+
+    def _sync(self, full: bool = False) -> int:
+        state = self._state()
+        full = (
+            full
+            or state is None
+            or not state["cursor"]
+            or time.time() - state["full_synced_at"] > self.full_sync_interval
+        )
+        filter_payload = None
+        if not full:
+            # last_edited_time has minute precision, so re-read the newest minute
+            filter_payload = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": state["cursor"]},
+            }
+        started_at = time.time()
+        pages = list(
+            CONTENT_PAGE.project_all(
+                self.notion_dal.iter_database(self.database_id, filter_payload)
+            )
+        )
+        cursor = max(
+            (p.last_edited_time for p in pages if p.last_edited_time),
+            default=state["cursor"] if state else None,
+        )
+        with self._lock, self._conn:
+            previous = self._previous(pages)
+            if full:
+                self._conn.execute("DELETE FROM pages")
+                self._conn.execute("DELETE FROM page_relations")
+            self._upsert(pages)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (
+                    self.database_id,
+                    cursor,
+                    started_at,
+                    started_at if full else state["full_synced_at"],
+                ),
+            )
+            self._counters["syncs"] += 1
+            self._counters["full_syncs"] += int(full)
+            self._counters["pages_synced"] += len(pages)
+        print(
+            f"Synced {len(pages)} Notion content pages "
+            f"({'full' if full else 'incremental'})"
+        )
+        self._notify(pages, previous)
+        return len(pages)
+
+    def upsert_pages(self, pages: Iterable[dict]):
+        """Apply pages returned by Notion writes (create/update) right away."""
+        records = [
+            CONTENT_PAGE.project(p)
+            for p in pages
+            if (p.get("parent") or {}).get("database_id", "").replace("-", "")
+            == self.database_id.replace("-", "")
+        ]
+        if not records:
+            return
+        with self._lock, self._conn:
+            previous = self._previous(records)
+            self._upsert(records)
+        self._notify(records, previous)
+
+    def find(
+        self,
+        status: Optional[str] = None,
+        client_id: Optional[str] = None,
+        max_age: Optional[float] = None,
+    ) -> List:
+        """
+        CONTENT_PAGE records matching every given condition, ordered by identifier.
+        :param client_id: Notion id of a client page, with or without dashes.
+        """
+        self.ensure_fresh(max_age)
+        query = "SELECT p.* FROM pages p"
+        conditions, params = [], []
+        if client_id:
+            query += " JOIN page_relations r ON r.page_id = p.id"
+            conditions.append("r.property = 'client_ids' AND r.related_id = ?")
+            params.append(self._normalize_id(client_id))
+        if status is not None:
+            conditions.append("p.status = ?")
+            params.append(status)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY p.identifier"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            relations = {}
+            for row in rows:
+                relations[row["id"]] = self._conn.execute(
+                    "SELECT property, related_id FROM page_relations WHERE page_id = ?",
+                    (row["id"],),
+                ).fetchall()
+        return [self._to_record(row, relations[row["id"]]) for row in rows]
+
+    def stats(self) -> dict:
+        state = self._state()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pages"] = self._conn.execute(
+                "SELECT COUNT(*) FROM pages"
+            ).fetchone()[0]
+        stats["age_seconds"] = (
+            None if state is None else time.time() - state["synced_at"]
+        )
+        stats["max_age"] = self.max_age
+        return stats
+
+    def _state(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM sync_state WHERE database_id = ?", (self.database_id,)
+            ).fetchone()
+
+    def _previous(self, records) -> dict:
+        # Caller holds self._lock
+        previous = {}
+        for record in records:
+            row = self._conn.execute(
+                "SELECT status, caption FROM pages WHERE id = ?", (record.id,)
+            ).fetchone()
+            if row is not None:
+                previous[record.id] = (row["status"], row["caption"])
+        return previous
+
+    def _notify(self, records, previous: dict):
+        changed = [r for r in records if previous.get(r.id) != (r.status, r.caption)]
+        if not changed:
+            return
+        for callback in self._listeners:
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"WARNING: Notion content listener failed: {e}")
+
+    def _upsert(self, records):
+        # Caller holds self._lock inside a transaction
+        for record in records:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.id,
+                    record.identifier,
+                    record.status,
+                    record.caption,
+                    record.image_description,
+                    record.drive_url,
+                    record.last_edited_time,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM page_relations WHERE page_id = ?", (record.id,)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO page_relations VALUES (?, ?, ?)",
+                [
+                    (record.id, prop, self._normalize_id(related_id))
+                    for prop in self.RELATIONS
+                    for related_id in getattr(record, prop)
+                ],
+            )
+
+    @staticmethod
+    def _normalize_id(notion_id: str) -> str:
+        return notion_id.replace("-", "").lower()
+
+    @classmethod
+    def _to_record(cls, row, relations):
+        record = CONTENT_PAGE.record_type()
+        for name in row.keys():
+            setattr(record, name, row[name])
+        for prop in cls.RELATIONS:
+            setattr(
+                record,
+                prop,
+                tuple(r["related_id"] for r in relations if r["property"] == prop),
+            )
+        return record
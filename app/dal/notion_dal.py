@@ -1,11 +1,31 @@
 import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
 
-from notion_client import Client as NotionClient
+from dal.notion_scheduler import BACKGROUND, ScheduledNotionClient
 
 
 class NotionDAL:
-    def __init__(self, token: str):
-        self.notion = NotionClient(auth=token)
+    PAGE_SIZE = 100  # Notion API upper bound for page_size
+    MAX_CHILDREN = 100  # blocks per create/append request
+    MAX_TEXT_LENGTH = 2000  # characters per rich text object
+
+    def __init__(
+        self, token: str, prefetch_workers: int = 4, requests_per_second: float = 3
+    ):
+        # Every call is paced and retried by the shared request scheduler
+        self.notion = ScheduledNotionClient(
+            auth=token, requests_per_second=requests_per_second
+        )
+        # Fetches the next page of a query while the caller handles the current one
+        self._prefetch = ThreadPoolExecutor(max_workers=prefetch_workers)
+
+    def background(self):
+        """Context manager: Notion calls made inside yield to interactive ones."""
+        return self.notion.priority(BACKGROUND)
+
+    def stats(self) -> dict:
+        return self.notion.stats()
 
     @staticmethod
     def extract_notion_id(url: str) -> str:
@@ -25,11 +45,29 @@ class NotionDAL:
     def retrieve_page(self, page_id):
         return self.notion.pages.retrieve(page_id)
 
-    def create_page(self, database_id, properties):
-        return self.notion.pages.create(
+    @classmethod
+    def rich_text(cls, content: str) -> List[dict]:
+        """Rich text value for content, split to fit Notion's per-object limit."""
+        return [
+            {"type": "text", "text": {"content": content[i : i + cls.MAX_TEXT_LENGTH]}}
+            for i in range(0, len(content), cls.MAX_TEXT_LENGTH)
+        ]
+
+    def create_page(self, database_id, properties, children=None):
+        """
+        Create a database page with its properties and body blocks in one request.
+        Blocks beyond the per-request limit are appended afterwards.
+        """
+        children = children or []
+        kwargs = {"children": children[: self.MAX_CHILDREN]} if children else {}
+        page = self.notion.pages.create(
             parent={"database_id": database_id},
             properties=properties,
+            **kwargs,
         )
+        if len(children) > self.MAX_CHILDREN:
+            self.append_blocks(page["id"], children[self.MAX_CHILDREN :])
+        return page
 
     def update_page(self, page_id, properties):
         """
@@ -44,18 +82,78 @@ class NotionDAL:
         )
 
     def append_blocks(self, page_id, children):
-        return self.notion.blocks.children.append(
-            block_id=page_id,
-            children=children,
-        )
+        response = None
+        for start in range(0, len(children), self.MAX_CHILDREN):
+            response = self.notion.blocks.children.append(
+                block_id=page_id,
+                children=children[start : start + self.MAX_CHILDREN],
+            )
+        return response
+
+    def iter_query_pages(
+        self,
+        database_id: str,
+        filter_payload: Optional[dict] = None,
+        sorts: Optional[List[dict]] = None,
+        page_size: int = PAGE_SIZE,
+        filter_properties: Optional[List[str]] = None,
+        prefetch: bool = True,
+    ) -> Iterator[dict]:
+        """
+        Query a Notion database and yield each response page as it arrives,
+        following next_cursor until has_more is false.
+        With prefetch, the next page is requested in the background while the
+        caller is still processing the current one.
+        :param filter_properties: Property IDs to return (all when omitted).
+        """
+        query = {"page_size": max(1, min(page_size, self.PAGE_SIZE))}
+        if filter_payload:
+            query["filter"] = filter_payload
+        if sorts:
+            query["sorts"] = sorts
+        if filter_properties:
+            query["filter_properties"] = filter_properties
+
+        # Prefetches run on pool threads but keep the caller's priority
+        priority = self.notion.current_priority()
+
+        def fetch(cursor):
+            with self.notion.priority(priority):
+                return self.notion.databases.query(
+                    database_id=database_id, start_cursor=cursor, **query
+                )
+
+        response = fetch(None)
+        while True:
+            cursor = response.get("next_cursor") if response.get("has_more") else None
+            next_page = (
+                self._prefetch.submit(fetch, cursor) if cursor and prefetch else None
+            )
+            yield response
+            if not cursor:
+                return
+            response = next_page.result() if next_page else fetch(cursor)
 
-    def query_database(self, database_id, filter_payload):
+    def iter_database(
+        self, database_id: str, filter_payload=None, **kwargs
+    ) -> Iterator[dict]:
         """
-        Query a Notion database using a filter.
+        Yield every page (row) matching the query, lazily across result pages.
+        Accepts the same keyword arguments as iter_query_pages.
+        """
+        for response in self.iter_query_pages(database_id, filter_payload, **kwargs):
+            yield from response.get("results", [])
+
+    def query_database(self, database_id, filter_payload=None, **kwargs):
+        """
+        Query a Notion database using a filter, following pagination.
         :param database_id: The Notion database ID.
         :param filter_payload: A dict representing the Notion filter.
-        :return: The API response (dict) containing the results.
+        :return: A list response (dict) whose "results" holds every matching page.
         """
-        return self.notion.databases.query(
-            database_id=database_id, filter=filter_payload
-        )
+        return {
+            "object": "list",
+            "results": list(self.iter_database(database_id, filter_payload, **kwargs)),
+            "has_more": False,
+            "next_cursor": None,
+        }
@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from notion_client import Client as NotionClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from dal.rate_limit import PriorityTokenBucket
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class ScheduledNotionClient(NotionClient):
+    """
+    notion_client.Client that paces every request through one token bucket
+    sized to Notion's limit (about 3 requests/second per integration).
+    Requests made inside `with client.priority(BACKGROUND)` wait behind
+    interactive ones. A 429 pauses the whole client for Retry-After seconds and
+    the request is retried; GETs are also retried on 5xx and timeouts.
+    """
+
+    RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+    def __init__(
+        self,
+        options=None,
+        client=None,
+        requests_per_second: float = 3,
+        burst: float = 3,
+        max_retries: int = 5,
+        base_delay: float = 1,
+        max_delay: float = 30,
+        **kwargs: Any,
+    ):
+        super().__init__(options, client, **kwargs)
+        self.bucket = PriorityTokenBucket(requests_per_second, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+        }
+        self._wait = {
+            INTERACTIVE: {"count": 0, "seconds": 0.0, "max": 0.0},
+            BACKGROUND: {"count": 0, "seconds": 0.0, "max": 0.0},
+        }
+
+    def current_priority(self) -> int:
+        return getattr(self._local, "priority", INTERACTIVE)
+
+    @contextmanager
+    def priority(self, priority: int):
+        """Run the requests made by this thread inside the block at priority."""
+        previous = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def request(
+        self,
+        path: str,
+        method: str,
+        query: Optional[Dict[Any, Any]] = None,
+        body: Optional[Dict[Any, Any]] = None,
+        auth: Optional[str] = None,
+    ) -> Any:
+        priority = self.current_priority()
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire(priority)
+            self._record_wait(priority, waited)
+            self._count("requests")
+            try:
+                return super().request(path, method, query, body, auth)
+            except (HTTPResponseError, RequestTimeoutError) as e:
+                status = getattr(e, "status", None)
+                if status == 429:
+                    self._count("rate_limited")
+                    delay = self._retry_after(e) or self._backoff(attempt)
+                    # The limit is per integration, so every caller backs off
+                    self.bucket.pause(delay)
+                elif method.upper() == "GET" and (
+                    status in self.RETRYABLE_STATUSES or status is None
+                ):
+                    delay = self._backoff(attempt)
+                else:
+                    self._count("failures")
+                    raise
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                print(
+                    f"Notion {method} {path} failed ({status or 'timeout'}), "
+                    f"retrying in {delay:.1f}s (retry {attempt + 1}/{self.max_retries})"
+                )
+                self._count("retries")
+                if status != 429:
+                    time.sleep(delay)
+                attempt += 1
+
+    @staticmethod
+    def _retry_after(error) -> Optional[float]:
+        headers = getattr(error, "headers", None)
+        value = headers.get("retry-after") if headers is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _record_wait(self, priority: int, seconds: float):
+        with self._lock:
+            wait = self._wait.setdefault(
+                priority, {"count": 0, "seconds": 0.0, "max": 0.0}
+            )
+            wait["count"] += 1
+            wait["seconds"] += seconds
+            wait["max"] = max(wait["max"], seconds)
+
+    def stats(self) -> dict:
+        names = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+        depth = self.bucket.queue_depth()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queue_depth"] = {
+                names.get(p, str(p)): depth.get(p, 0) for p in self._wait
+            }
+            stats["wait_seconds"] = {
+                names.get(p, str(p)): {
+                    "average": w["seconds"] / w["count"] if w["count"] else 0.0,
+                    "max": w["max"],
+                    "total": w["seconds"],
+                }
+                for p, w in self._wait.items()
+            }
+        return stats
@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve tokens up front and sleep off any
+    deficit, so concurrent callers are served in arrival order instead of racing
+    for refills.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> float:
+        """
+        Blocks until `tokens` are available and returns the seconds spent waiting.
+        A request larger than the bucket (e.g. a whole Drive batch) leaves it in
+        debt, which later callers wait off, so every token is paid at `rate`.
+        Raises TimeoutError (without consuming anything) if that would take
+        longer than timeout.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                raise TimeoutError(
+                    f"Rate limiter would block for {wait:.1f}s (timeout {timeout:.1f}s)"
+                )
+            self._tokens -= tokens
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class PriorityTokenBucket:
+    """
+    Token bucket whose waiters are served by priority (lower first), then in
+    arrival order, so interactive calls overtake queued background work.
+    pause() stops all grants for a while, e.g. when the server sends Retry-After.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._available = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, priority: int = 0) -> float:
+        """Blocks until this caller is granted a token; returns the seconds waited."""
+        start = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._available:
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiters[0] == ticket:
+                    wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                    if wait <= 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        # The next waiter becomes head and must recompute its wait
+                        self._available.notify_all()
+                        return now - start
+                    self._available.wait(wait)
+                else:
+                    self._available.wait()
+
+    def pause(self, seconds: float):
+        with self._available:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._available.notify_all()
+
+    def queue_depth(self) -> Dict[int, int]:
+        """Number of waiting callers per priority."""
+        with self._available:
+            depth = {}
+            for priority, _ in self._waiters:
+                depth[priority] = depth.get(priority, 0) + 1
+            return depth
+
+
+class SlidingWindowCounter:
+    """Counts events over the last `window` seconds, e.g. quota units per minute."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._events = deque()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount: float = 1):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, amount))
+            self._total += amount
+            self._expire(now)
+
+    def value(self) -> float:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._total
+
+    def _expire(self, now: float):
+        while self._events and now - self._events[0][0] > self.window:
+            self._total -= self._events.popleft()[1]
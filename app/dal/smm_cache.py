@@ -0,0 +1,119 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from models.notion_projection import SMM_PAGE
+
+
+@dataclass
+class SmmData:
+    """Fields the app reads from a Social Media Management (SMM) page."""
+
+    page_id: str
+    last_edited_time: Optional[str]
+    cycle_id: Optional[str]
+    cycle_start: Optional[str]
+    targets: Dict[str, int]
+    hashtags: List[str]
+    prompt: Optional[str] = None  # read from the page body on first use
+    fetched_at: float = field(default_factory=time.monotonic)
+
+
+class SmmCache:
+    """
+    Shared cache of SMM page data, keyed by page id and last_edited_time.
+    Entries younger than ttl seconds are served without calling Notion. Older
+    entries are revalidated with a single page retrieve: if last_edited_time is
+    unchanged (block edits also bump it) the parsed data, including the prompt
+    from the page body, is reused instead of listing the blocks again.
+    """
+
+    def __init__(self, notion_dal, ttl: float = 300):
+        self.notion_dal = notion_dal
+        self.ttl = ttl
+        self._entries: Dict[str, SmmData] = {}
+        self._page_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "revalidated": 0, "misses": 0}
+
+    def get(self, page_id: str) -> SmmData:
+        # One fetch per page at a time; concurrent callers reuse its result
+        with self._page_lock(page_id):
+            entry = self._entries.get(page_id)
+            if entry and time.monotonic() - entry.fetched_at <= self.ttl:
+                self._count("hits")
+                return entry
+
+            page = self.notion_dal.retrieve_page(page_id)
+            last_edited_time = page.get("last_edited_time")
+            if (
+                entry
+                and last_edited_time
+                and entry.last_edited_time == last_edited_time
+            ):
+                self._count("revalidated")
+                entry.fetched_at = time.monotonic()
+                return entry
+
+            self._count("misses")
+            entry = self._parse(page_id, page)
+            with self._lock:
+                self._entries[page_id] = entry
+            return entry
+
+    def get_prompt(self, page_id: str) -> str:
+        entry = self.get(page_id)
+        with self._page_lock(page_id):
+            if entry.prompt is None:
+                entry.prompt = self._fetch_prompt(page_id)
+            return entry.prompt
+
+    def invalidate(self, page_id: Optional[str] = None):
+        """Drop one page (or everything) so the next read goes to Notion."""
+        with self._lock:
+            if page_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(page_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _page_lock(self, page_id: str) -> threading.Lock:
+        with self._lock:
+            return self._page_locks.setdefault(page_id, threading.Lock())
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _fetch_prompt(self, page_id: str) -> str:
+        # Prompt is the text of the paragraph blocks on the page
+        prompt = ""
+        blocks = self.notion_dal.notion.blocks.children.list(block_id=page_id)
+        for block in blocks.get("results", []):
+            if block["type"] == "paragraph" and block["paragraph"]["rich_text"]:
+                prompt += block["paragraph"]["rich_text"][0]["text"]["content"] + "\n"
+        return prompt.strip()
+
+    @staticmethod
+    def _parse(page_id: str, page: dict) -> SmmData:
+        smm = SMM_PAGE.project(page)
+        if not smm.cycle_id:
+            print(f"'Cycle ID' not set on SMM page {page_id}.")
+        return SmmData(
+            page_id=page_id,
+            last_edited_time=smm.last_edited_time,
+            cycle_id=smm.cycle_id or None,
+            cycle_start=smm.cycle_start,
+            targets={
+                "Photo Posts": smm.photo_posts or 0,
+                "Short Videos": smm.short_videos or 0,
+                "Long Videos": smm.long_videos or 0,
+            },
+            hashtags=smm.hashtags.split(),
+        )
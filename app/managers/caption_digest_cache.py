@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+@dataclass
+class CaptionDigest:
+    """Rendered /captions text of one client with its validators."""
+
+    message: str
+    etag: str
+    last_modified: datetime  # when the text last changed
+    built_at: float = field(default_factory=time.monotonic)
+
+
+class CaptionDigestCache:
+    """
+    Per-client cache of the caption digest served by /client/<uuid>/captions.
+    A digest is rebuilt when it is older than ttl seconds or after one of the
+    client's content pages changed (see invalidate_pages). A rebuild that
+    yields the same text keeps its ETag and Last-Modified, so clients holding
+    it still get a 304.
+    """
+
+    def __init__(self, build: Callable[[str], Tuple[str, Optional[str]]], ttl=300):
+        # build(client_uuid) -> (message, error), e.g. get_captions_for_client
+        self.build = build
+        self.ttl = ttl
+        self._entries: Dict[str, CaptionDigest] = {}
+        self._client_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "rebuilds": 0, "invalidations": 0}
+
+    def get(self, client_uuid: str) -> Tuple[Optional[CaptionDigest], Optional[str]]:
+        with self._client_lock(client_uuid):
+            entry = self._entries.get(client_uuid)
+            if entry and time.monotonic() - entry.built_at <= self.ttl:
+                self._count("hits")
+                return entry, None
+
+            self._count("rebuilds")
+            message, error = self.build(client_uuid)
+            if error and not message:
+                # Nothing to serve (unknown client, no posts); not cached
+                self.invalidate(client_uuid)
+                return None, error
+            etag = hashlib.sha1(message.encode("utf-8")).hexdigest()
+            if entry and entry.etag == etag:
+                entry.built_at = time.monotonic()
+                return entry, None
+            entry = CaptionDigest(
+                message=message,
+                etag=etag,
+                last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            )
+            with self._lock:
+                self._entries[client_uuid] = entry
+            return entry, None
+
+    def invalidate(self, client_uuid: Optional[str] = None):
+        """Force a rebuild on the next read; clears every client when omitted."""
+        with self._lock:
+            if client_uuid is None:
+                self._entries.clear()
+            else:
+                entry = self._entries.get(client_uuid)
+                if entry:
+                    # Keep the validators so an unchanged rebuild still matches
+                    entry.built_at = float("-inf")
+                    self._counters["invalidations"] += 1
+
+    def invalidate_pages(self, pages: Iterable, client_map):
+        """Invalidate the clients related to changed CONTENT_PAGE records."""
+        notion_ids = {
+            cid.replace("-", "").lower() for p in pages for cid in p.client_ids
+        }
+        if not notion_ids:
+            return
+        for client in list(client_map.clients.values()):
+            notion_id = client.get_notion_id("notion_page_id")
+            if notion_id and notion_id.replace("-", "").lower() in notion_ids:
+                self.invalidate(client.uuid)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _client_lock(self, client_uuid: str) -> threading.Lock:
+        with self._lock:
+            return self._client_locks.setdefault(client_uuid, threading.Lock())
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
@@ -0,0 +1,199 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+
+class ChannelManager:
+    """
+    Keeps one Drive push-notification channel (files.watch) open on every
+    client's next_post_id folder.
+    Channel id, resource id and expiration are stored on the client in the
+    client map, which also indexes clients by channel id for webhook routing.
+    A background thread renews each channel renew_margin seconds before it
+    expires; the replacement is opened before the old channel is stopped so no
+    notifications are lost in between.
+    Notifications trigger an incremental next-post sync on a worker thread;
+    notifications that arrive while a client's sync is already queued are
+    folded into it.
+    """
+
+    ACTIONABLE_STATES = {"add", "change", "update"}
+
+    def __init__(
+        self,
+        client_map,
+        drive_dal,
+        client_manager,
+        webhook_url: str,
+        client_map_path: str = "client_map.json",
+        ttl: int = 86400,
+        renew_margin: int = 3600,
+        check_interval: int = 600,
+    ):
+        self.client_map = client_map
+        self.drive_dal = drive_dal
+        self.client_manager = client_manager
+        self.webhook_url = webhook_url
+        self.client_map_path = client_map_path
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._sync_executor = ThreadPoolExecutor(max_workers=1)
+        self._queued = set()
+
+    def start(self):
+        """Start the renewal scheduler; channels are checked immediately."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="drive-channel-renewal", daemon=True
+        )
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._sync_executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.ensure_channels()
+            except Exception as e:
+                print(f"ERROR: Drive channel renewal failed: {e}")
+            self._stop.wait(self.seconds_until_next_renewal())
+
+    def seconds_until_next_renewal(self) -> float:
+        """Time until the earliest channel is due, capped at check_interval."""
+        wait = self.check_interval
+        now = time.time()
+        for client in list(self.client_map.clients.values()):
+            if client.drive_channel_expiration:
+                due = client.drive_channel_expiration / 1000 - self.renew_margin
+                wait = min(wait, max(0, due - now))
+        return wait
+
+    def needs_renewal(self, client) -> bool:
+        if not client.drive_channel_id or not client.drive_channel_expiration:
+            return True
+        expires_at = client.drive_channel_expiration / 1000
+        return expires_at - time.time() <= self.renew_margin
+
+    def ensure_channels(self) -> int:
+        """
+        Open channels for clients without one and renew those close to expiry.
+        Returns the number of channels opened.
+        """
+        if not self.webhook_url:
+            raise ValueError("DRIVE_WEBHOOK_URL is not configured")
+        opened = 0
+        for client in list(self.client_map.clients.values()):
+            if not client.get_google_drive_id("next_post_id"):
+                continue
+            if not self.needs_renewal(client):
+                continue
+            try:
+                self.renew(client, save=False)
+                opened += 1
+            except Exception as e:
+                print(
+                    f"ERROR: Failed to watch next_post_id for {client.client_name}: {e}"
+                )
+        if opened:
+            self.client_map.save_to_file(self.client_map_path)
+        return opened
+
+    def renew(self, client, save: bool = True):
+        """Open a new channel on the client's next_post_id folder, then stop the old one."""
+        folder_id = client.get_google_drive_id("next_post_id")
+        if not folder_id:
+            raise ValueError(f"next_post_id not configured for {client.client_name}")
+        old_channel = (client.drive_channel_id, client.drive_channel_resource_id)
+
+        channel = self.drive_dal.watch_file(
+            folder_id,
+            channel_id=str(uuid.uuid4()),
+            address=self.webhook_url,
+            token=client.uuid,
+            ttl=self.ttl,
+        )
+        with self._lock:
+            self.client_map.set_channel(
+                client,
+                channel["id"],
+                channel.get("resourceId"),
+                int(channel["expiration"]) if channel.get("expiration") else None,
+            )
+        print(
+            f"Watching next_post_id of {client.client_name} on channel "
+            f"{channel['id']} until {client.drive_channel_expiration}"
+        )
+        if all(old_channel):
+            self._stop_channel(*old_channel)
+        if save:
+            self.client_map.save_to_file(self.client_map_path)
+
+    def stop(self, client, save: bool = True):
+        """Stop the client's channel and forget it."""
+        if client.drive_channel_id and client.drive_channel_resource_id:
+            self._stop_channel(
+                client.drive_channel_id, client.drive_channel_resource_id
+            )
+        with self._lock:
+            self.client_map.set_channel(client, None)
+        if save:
+            self.client_map.save_to_file(self.client_map_path)
+
+    def _stop_channel(self, channel_id: str, resource_id: str):
+        try:
+            self.drive_dal.stop_channel(channel_id, resource_id)
+        except HttpError as e:
+            # An expired or unknown channel is already gone
+            if e.resp.status != 404:
+                print(f"WARNING: Failed to stop Drive channel {channel_id}: {e}")
+
+    def handle_notification(
+        self, channel_id: str, resource_state: str, token: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Route a Drive notification to its client and queue an incremental sync.
+        Returns the client uuid when a sync was queued or is already pending.
+        """
+        client = self.client_map.get_client_by_channel(channel_id)
+        if client is None:
+            print(f"Ignoring notification for unknown channel {channel_id}")
+            return None
+        if token is not None and token != client.uuid:
+            print(f"Ignoring notification with mismatched token on {channel_id}")
+            return None
+        if resource_state not in self.ACTIONABLE_STATES:
+            return None
+
+        with self._lock:
+            if client.uuid in self._queued:
+                return client.uuid
+            self._queued.add(client.uuid)
+        self._sync_executor.submit(self._sync, client.uuid)
+        return client.uuid
+
+    def _sync(self, client_uuid: str):
+        # Changes made while this sync runs queue another one
+        with self._lock:
+            self._queued.discard(client_uuid)
+        try:
+            with self.client_manager.notion_dal.background():
+                self.client_manager.sync_next_posts_from_drive_to_notion(
+                    client_uuid, incremental=True
+                )
+        except Exception as e:
+            print(f"ERROR: Incremental sync for {client_uuid} failed: {e}")
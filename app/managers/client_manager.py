@@ -5,8 +5,12 @@ from dal.client_drive_dal import ClientDriveDAL
 from dal.client_notion_dal import ClientNotionDAL
 from dal.google_drive_dal import GoogleDriveDAL
 from dal.notion_dal import NotionDAL
+from dal.smm_cache import SmmCache
+from managers.caption_digest_cache import CaptionDigestCache
 from models.client import Client
 from models.client_map import ClientMap
+from models.notion_projection import CONTENT_PAGE
+from services.caption_pipeline import CaptionPipeline
 
 
 class ClientManager:
@@ -18,8 +22,31 @@ class ClientManager:
         notion_db_id,
         vision_service,
         gemini_service,
+        client_map_path="client_map.json",
+        image_derivatives=None,
+        smm_cache=None,
+        content_store=None,
+        caption_digest_ttl=300,
+        caption_pipeline=None,
     ):
         self.client_map = client_map
+        self.smm_cache = smm_cache or SmmCache(notion_dal)
+        # Local mirror of the content database; reads go to Notion without it
+        self.content_store = content_store
+        # Shared so its per-stage rate limits hold across concurrent runs
+        self.caption_pipeline = caption_pipeline or CaptionPipeline(
+            drive_dal, vision_service, gemini_service, notion_dal, self.smm_cache
+        )
+        self.caption_digests = CaptionDigestCache(
+            self.get_captions_for_client, ttl=caption_digest_ttl
+        )
+        if content_store:
+            # Caption writes and synced status changes invalidate the digest
+            content_store.add_listener(
+                lambda pages: self.caption_digests.invalidate_pages(pages, client_map)
+            )
+        self.client_map_path = client_map_path
+        self.image_derivatives = image_derivatives
         self.drive_dal = drive_dal
         self.notion_dal = notion_dal
         self.notion_db_id = notion_db_id
@@ -30,12 +57,15 @@ class ClientManager:
         client = self.client_map.get_client(client_uuid)
         if not client:
             raise ValueError(f"Client UUID {client_uuid} not found.")
-        client_drive_dal = ClientDriveDAL(client, self.drive_dal)
+        client_drive_dal = ClientDriveDAL(
+            client, self.drive_dal, image_derivatives=self.image_derivatives
+        )
         return client_drive_dal.get_ready_images()
 
     def generate_captions_for_client(self, client_uuid):
         """
         Generates captions for all Notion pages with 'Suggest Caption' status for the given client.
+        Returns the caption run summary.
         """
         client = self.client_map.get_client(client_uuid)
         if not client:
@@ -47,8 +77,11 @@ class ClientManager:
             self.drive_dal,
             self.vision_service,
             self.gemini_service,
+            smm_cache=self.smm_cache,
+            content_store=self.content_store,
+            caption_pipeline=self.caption_pipeline,
         )
-        notion.generate_captions_for_suggested()
+        return notion.generate_captions_for_suggested()
 
     def get_captions_for_client(self, client_uuid):
         client = self.client_map.get_client(client_uuid)
@@ -61,40 +94,31 @@ class ClientManager:
         # Use the dashed version, as shown in your Notion data
         client_notion_id = client_notion_id.lower()
 
-        filter_payload = {
-            "and": [
-                {"property": "Status", "status": {"equals": "Caption Generated"}},
-                {"property": "Client", "relation": {"contains": client_notion_id}},
-            ]
-        }
-        results = self.notion_dal.query_database(
-            "1e8add08074880faa661d372bdb63bce", filter_payload
-        )
-        items = results.get("results", [])
+        if self.content_store:
+            pages = self.content_store.find(
+                status="Caption Generated", client_id=client_notion_id
+            )
+        else:
+            filter_payload = {
+                "and": [
+                    {"property": "Status", "status": {"equals": "Caption Generated"}},
+                    {"property": "Client", "relation": {"contains": client_notion_id}},
+                ]
+            }
+            pages = CONTENT_PAGE.project_all(
+                self.notion_dal.iter_database(
+                    "1e8add08074880faa661d372bdb63bce", filter_payload
+                )
+            )
 
         posts = []
-        for page in items:
-            props = page.get("properties", {})
-            identifier_prop = props.get("Identifier", {})
-            identifier_text = ""
-            if identifier_prop.get("type") == "title":
-                title_objs = identifier_prop.get("title", [])
-                if title_objs:
-                    identifier_text = title_objs[0].get("plain_text", "")
-            match = re.match(r"(\d+)[-–]", identifier_text.strip())
+        for page in pages:
+            match = re.match(r"(\d+)[-–]", page.identifier.strip())
             if not match:
                 continue
             number = int(match.group(1))
-
-            # Extract the caption text
-            caption_prop = props.get("Caption", {})
-            caption_text = ""
-            if caption_prop.get("type") == "rich_text":
-                rich_texts = caption_prop.get("rich_text", [])
-                if rich_texts:
-                    caption_text = rich_texts[0].get("plain_text", "")
-            if caption_text:
-                posts.append((number, caption_text.strip()))
+            if page.caption:
+                posts.append((number, page.caption.strip()))
 
         if not posts:
             return "", "No posts found for this client."
@@ -105,6 +129,10 @@ class ClientManager:
         message = "\n".join(message_lines)
         return message, None
 
+    def get_caption_digest(self, client_uuid):
+        """Cached get_captions_for_client; returns (CaptionDigest, error)."""
+        return self.caption_digests.get(client_uuid)
+
     def create_client_from_payload(self, payload):
         notion_url = payload.get("notion_url")
         if not notion_url:
@@ -135,7 +163,7 @@ class ClientManager:
             client.add_resource("notion", key, notion_id, description, url)
 
         self.client_map.add_client(client)
-        self.client_map.save_to_file("client_map.json")
+        self.client_map.save_to_file(self.client_map_path)
         return client
 
     def ensure_content_buffer(self, todoist_dal, today=None):
@@ -152,6 +180,8 @@ class ClientManager:
                 self.drive_dal,
                 self.vision_service,
                 self.gemini_service,
+                smm_cache=self.smm_cache,
+                content_store=self.content_store,
             )
             cycle_start_str, targets = notion.get_cycle_start_and_targets(smm_id)
             if not cycle_start_str:
@@ -197,8 +227,19 @@ class ClientManager:
                         todoist_dal.create_task(content, due_string=due_string)
                         print(f"Created Todoist task: {content}")
 
-    def sync_next_posts_from_drive_to_notion(self, channel_id):
+    def sync_next_posts_from_drive_to_notion(self, channel_id, incremental=False):
+        """
+        Creates Notion content pages for the files in the client's next_post_id folder.
+        In incremental mode the Drive Changes API cursor stored on the client is
+        advanced and only posts with a file that is not yet synced (new, renamed,
+        or whose page could not be created before) are processed; a secondary
+        image arriving after its post was created is added to that page. The
+        first incremental run falls back to a full listing to establish the cursor.
+        Returns a summary of the run, including the number of Drive API calls made.
+        """
         client = self.client_map.get_client(channel_id)
+        if not client:
+            raise ValueError(f"Client UUID {channel_id} not found.")
 
         drive = ClientDriveDAL(client, self.drive_dal)
         notion = ClientNotionDAL(
@@ -208,66 +249,190 @@ class ClientManager:
             self.drive_dal,
             self.vision_service,
             self.gemini_service,
+            smm_cache=self.smm_cache,
+            content_store=self.content_store,
         )
 
-        files = drive.list_next_posts()
-        if not files:
-            print(f"No files found in next_post_id for client {client.client_name}.")
-            return
+        with self.drive_dal.executor.count_calls() as drive_calls:
+            if incremental and client.drive_changes_token:
+                changed, removed_ids, new_token = drive.list_next_post_changes(
+                    client.drive_changes_token, known=client.synced_next_posts
+                )
+                # Posts are rebuilt from the whole folder (usually answered by
+                # the metadata store), so a carousel split across runs is
+                # completed and failed posts are retried
+                files = {f["id"]: f for f in drive.iter_next_posts()}
+                files.update((f["id"], f) for f in changed)
+                for file_id in removed_ids:
+                    files.pop(file_id, None)
+                files = list(files.values())
+                in_folder = {f["id"] for f in files}
+                synced = {
+                    file_id: name
+                    for file_id, name in client.synced_next_posts.items()
+                    if file_id in in_folder
+                }
+                pages = {
+                    file_id: page_id
+                    for file_id, page_id in client.next_post_pages.items()
+                    if file_id in in_folder
+                }
+            else:
+                # Take the cursor before listing so changes made meanwhile are not lost
+                new_token = self.drive_dal.get_start_page_token()
+                files = list(drive.iter_next_posts())
+                synced, pages = {}, {}
+                incremental = False
+
+            summary = self._sync_next_post_files(
+                client,
+                drive,
+                notion,
+                files,
+                synced,
+                pages,
+                check_sequence=not incremental,
+            )
+
+        client.drive_changes_token = new_token
+        client.synced_next_posts = synced
+        client.next_post_pages = pages
+        self.client_map.save_to_file(self.client_map_path)
+
+        summary["mode"] = "incremental" if incremental else "full"
+        summary["drive_api_calls"] = drive_calls["calls"]
+        print(
+            f"Synced next posts for {client.client_name}: {summary['posts_created']} "
+            f"posts and {summary['images_added']} added images from "
+            f"{summary['files']} new files, {summary['files_moved']} files moved, "
+            f"{summary['drive_api_calls']} Drive API calls."
+        )
+        return summary
 
+    def _sync_next_post_files(
+        self, client, drive, notion, files, synced, pages, check_sequence=True
+    ):
+        """
+        Groups next-post files by number and handles every group holding a file
+        not in synced ({file id: name}): matching fotos files are moved to
+        scheduling in one batch, a Notion page is created when the main image
+        is new, and new secondary images are appended to the main image's page
+        (pages: {main file id: page id}).
+        synced and pages are updated in place, only for files whose page was
+        written. Returns a summary dict with file, move, post and image counts.
+        """
         from collections import defaultdict
 
+        summary = {"files": 0, "files_moved": 0, "posts_created": 0, "images_added": 0}
+
+        def is_synced(file):
+            return synced.get(file["id"]) == file["name"]
+
         groups = defaultdict(list)
+        match_keys = set()
         for file in files:
             file_name = file["name"]
             group_key, num, letter, match_key = drive.parse_file_name(file_name)
             if num is None:
-                print(
-                    f"WARNING: File '{file_name}' does not match expected pattern, skipping."
-                )
+                if not is_synced(file):
+                    print(
+                        f"WARNING: File '{file_name}' does not match expected pattern, skipping."
+                    )
+                    # Looked at again only if it is renamed
+                    synced[file["id"]] = file_name
                 continue
-            if match_key:  # Only move if match_key is not empty
-                drive.move_matching_files(match_key)
+            if not is_synced(file):
+                summary["files"] += 1
+                if match_key:  # Only move if match_key is not empty
+                    match_keys.add(match_key)
             groups[num].append((letter, file))
 
-        sorted_group_keys = sorted(groups.keys(), key=lambda x: int(x))
+        if not summary["files"]:
+            print(f"No new files in next_post_id for client {client.client_name}.")
+            return summary
+
+        # One listing of fotos_id and one batch of moves for every match key
+        summary["files_moved"] = drive.move_matching_files(match_keys)
+
         last_number = 0
-        for group_num in sorted_group_keys:
-            try:
-                curr_number = int(group_num)
-                if curr_number != last_number + 1:
+        posts = []
+        additions = []
+        for group_num in sorted(groups.keys(), key=lambda x: int(x)):
+            curr_number = int(group_num)
+            # Only a full listing is expected to be contiguous from 1
+            if check_sequence and curr_number != last_number + 1:
+                print(
+                    f"ERROR: Missing main image for expected number {last_number + 1}."
+                )
+            last_number = curr_number
+
+            group_files = sorted(groups[group_num], key=lambda x: (x[0] == "", x[0]))
+            if all(is_synced(file) for _, file in group_files):
+                continue
+            main_image = next((f for l, f in group_files if l == ""), None)
+            if not main_image:
+                # Left unsynced, so the group is handled once the main image arrives
+                for letter, file in group_files:
                     print(
-                        f"ERROR: Missing main image for expected number {last_number + 1}."
+                        f"ERROR: Secondary image {file['name']} found but main image {group_num} is missing."
                     )
-                last_number = curr_number
+                continue
 
-                group_files = sorted(
-                    groups[group_num], key=lambda x: (x[0] == "", x[0])
-                )
-                main_image = next((f for l, f in group_files if l == ""), None)
-                if not main_image:
-                    for letter, file in group_files:
-                        print(
-                            f"ERROR: Secondary image {file['name']} found but main image {group_num} is missing."
-                        )
+            if is_synced(main_image):
+                page_id = pages.get(main_image["id"])
+                new_images = [f for l, f in group_files if not is_synced(f)]
+                if not page_id:
+                    print(
+                        f"ERROR: No Notion page recorded for {main_image['name']}; cannot add {len(new_images)} images."
+                    )
                     continue
+                additions.append((page_id, new_images))
+                continue
 
-                file_id = main_image["id"]
-                file_name = main_image["name"]
-                drive.make_file_public(file_id)
+            body_images = [main_image]
+            for letter, file in group_files:
+                if letter != "":
+                    print(f"Adding secondary image to body: {file['name']}")
+                    body_images.append(file)
+            posts.append((group_num, main_image, body_images))
 
-                body_images = [main_image]
-                for letter, file in sorted(
-                    group_files, key=lambda x: (x[0] == "", x[0])
-                ):
-                    if letter != "":
-                        print(f"Adding secondary image to body: {file['name']}")
-                        body_images.append(file)
+        # One batched round of permission changes for every main image
+        drive.make_files_public([main_image["id"] for _, main_image, _ in posts])
 
-                notion.add_content_grouped(file_name, file_id, body_images)
+        for group_num, main_image, body_images in posts:
+            try:
+                page_id = notion.add_content_grouped(
+                    main_image["name"], main_image["id"], body_images
+                )
             except Exception as e:
                 print(f"ERROR: Failed processing group {group_num}: {e}")
                 continue
+            if page_id:
+                summary["posts_created"] += 1
+                pages[main_image["id"]] = page_id
+                synced.update((f["id"], f["name"]) for f in body_images)
+
+        for page_id, images in additions:
+            if notion.add_images_to_content(page_id, images):
+                summary["images_added"] += len(images)
+                synced.update((f["id"], f["name"]) for f in images)
+        return summary
+
+    def reconcile_drive_metadata(self):
+        """
+        Re-lists every Drive folder configured for a client, plus any other folder
+        the metadata store tracks (e.g. date-group subfolders), so the local
+        mirror converges with Drive even if a change notification was missed.
+        Returns the number of folders refreshed.
+        """
+        store = self.drive_dal.metadata_store
+        if store is None:
+            return 0
+        folder_ids = set(store.tracked_folders())
+        for client in self.client_map.clients.values():
+            folder_ids.update(entry.id for entry in client.google_drive.values())
+        self.drive_dal.refresh_folders(sorted(folder_ids))
+        return len(folder_ids)
 
     def get_next_buffer_deadline(self, today, cycle_start):
         # Find the next Monday after today
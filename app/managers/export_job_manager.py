@@ -0,0 +1,231 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from dal.drive_metadata_store import DriveMetadataStore
+
+
+@dataclass
+class ExportItem:
+    position: Optional[int]
+    original_id: str
+    new_filename: str
+    status: str = "pending"  # pending, copying, done, skipped, error
+    file_id: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return {
+            "position": self.position,
+            "originalId": self.original_id,
+            "newFilename": self.new_filename,
+            "status": self.status,
+            "fileId": self.file_id,
+            "error": self.error,
+        }
+
+
+@dataclass
+class ExportJob:
+    id: str
+    client_id: str
+    client_name: str
+    folder_id: str
+    items: List[ExportItem]
+    status: str = "queued"  # queued, running, completed, failed
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        counts = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return {
+            "jobId": self.id,
+            "clientId": self.client_id,
+            "status": self.status,
+            "error": self.error,
+            "total": len(self.items),
+            "counts": counts,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+            "items": [item.to_dict() for item in self.items],
+        }
+
+
+class ExportJobManager:
+    """
+    Runs /export requests in the background.
+    Each job lists the client's next_post_id folder once and skips images whose
+    new filename is already there (or being exported by another job), so
+    re-submitting the same selection is safe. The remaining copies are split
+    into batches that run on a bounded pool of workers (sending on transports
+    from the DAL's client pool), and every item's progress is kept on the job
+    for polling.
+    """
+
+    def __init__(
+        self,
+        drive_dal,
+        max_jobs: int = 2,
+        copy_workers: int = 4,
+        batch_size: int = 20,
+        keep_finished: int = 100,
+    ):
+        self.drive_dal = drive_dal
+        self.batch_size = max(1, batch_size)
+        self.keep_finished = keep_finished
+        self._jobs = OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._job_executor = ThreadPoolExecutor(max_workers=max(1, max_jobs))
+        self._copy_executor = ThreadPoolExecutor(max_workers=max(1, copy_workers))
+
+    @staticmethod
+    def parse_items(items) -> List[ExportItem]:
+        """Flattens the picker payload into one ExportItem per image."""
+        export_items = []
+        for item in items:
+            position = item.get("position")
+            for image in item.get("images", []):
+                original_id = image.get("originalId", "")
+                export_prefix = (
+                    image.get("exportFilename", "")
+                    .replace(".jpg", "")
+                    .replace(".jpeg", "")
+                    .replace(".png", "")
+                )
+                original_filename = image.get("originalFilename", "")
+                export_item = ExportItem(
+                    position=position,
+                    original_id=original_id,
+                    new_filename=f"{export_prefix}-{original_filename}",
+                )
+                if not original_id or not export_prefix or not original_filename:
+                    export_item.status = "error"
+                    export_item.error = f"Missing data for item at position {position}"
+                export_items.append(export_item)
+        return export_items
+
+    def submit(self, client, folder_id: str, items) -> ExportJob:
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            client_id=client.uuid,
+            client_name=client.client_name,
+            folder_id=folder_id,
+            items=self.parse_items(items),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._job_executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _set(self, target, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(target, name, value)
+
+    def _run(self, job: ExportJob):
+        self._set(job, status="running")
+        claimed = []
+        try:
+            # Drive's current state, not the metadata mirror: an export deleted
+            # moments ago must be copied again (the listing refreshes the mirror)
+            existing = {
+                f["name"]
+                for f in self.drive_dal.iter_files_in_folder(
+                    job.folder_id, fields="files(id, name)", max_age=0
+                )
+            }
+            pending = []
+            with self._lock:
+                for item in job.items:
+                    if item.status != "pending":
+                        continue
+                    key = (job.folder_id, item.new_filename)
+                    if item.new_filename in existing or key in self._in_flight:
+                        item.status = "skipped"
+                        continue
+                    self._in_flight.add(key)
+                    claimed.append(key)
+                    pending.append(item)
+
+            chunks = [
+                pending[i : i + self.batch_size]
+                for i in range(0, len(pending), self.batch_size)
+            ]
+            wait(
+                [
+                    self._copy_executor.submit(self._copy_chunk, job, chunk)
+                    for chunk in chunks
+                ]
+            )
+            self._set(job, status="completed")
+        except Exception as e:
+            print(f"ERROR: Export job {job.id} failed: {e}")
+            self._set(job, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(claimed)
+                for item in job.items:
+                    if item.status in ("pending", "copying"):
+                        item.status = "error"
+                        item.error = item.error or "Export job did not finish"
+                job.finished_at = time.time()
+            print(
+                f"Export job {job.id} for {job.client_name} {job.status}: "
+                f"{job.to_dict()['counts']}"
+            )
+
+    def _copy_chunk(self, job: ExportJob, items: List[ExportItem]):
+        try:
+            batch = self.drive_dal.new_batch()
+            for item in items:
+                batch.add(
+                    self.drive_dal.service.files().copy(
+                        fileId=item.original_id,
+                        body={"name": item.new_filename, "parents": [job.folder_id]},
+                        fields=DriveMetadataStore.FILE_FIELDS,
+                    ),
+                    key=id(item),
+                )
+                self._set(item, status="copying")
+            results = batch.execute()
+        except Exception as e:
+            for item in items:
+                self._set(item, status="error", error=str(e))
+            return
+
+        for item in items:
+            result = results.get(id(item))
+            if result is not None and result.ok and result.response.get("id"):
+                self.drive_dal.record_file(result.response)
+                self._set(item, status="done", file_id=result.response["id"])
+                print(f"Exported {item.new_filename} to {job.client_name}'s next posts")
+            else:
+                error = result.error if result is not None else None
+                self._set(
+                    item,
+                    status="error",
+                    error=str(error) if error else "Failed to copy file",
+                )
@@ -1,6 +1,8 @@
 from dataclasses import asdict, dataclass, field
 from typing import Dict, Optional
 
+from models.notion_projection import CLIENT_PAGE
+
 
 @dataclass
 class ResourceEntry:
@@ -18,6 +20,18 @@ class Client:
     notion_url: str
     google_drive: Dict[str, ResourceEntry] = field(default_factory=dict)
     notion: Dict[str, ResourceEntry] = field(default_factory=dict)
+    # Drive Changes API cursor used by incremental next-post syncs
+    drive_changes_token: Optional[str] = None
+    # next_post_id files already synced (id -> name), so changes that neither
+    # add nor rename a file (permissions, metadata) do not create posts again
+    synced_next_posts: Dict[str, str] = field(default_factory=dict)
+    # Notion page created for each synced main image (file id -> page id), so
+    # secondary images arriving later are added to the existing post
+    next_post_pages: Dict[str, str] = field(default_factory=dict)
+    # Drive push-notification channel watching the next_post_id folder
+    drive_channel_id: Optional[str] = None
+    drive_channel_resource_id: Optional[str] = None
+    drive_channel_expiration: Optional[int] = None  # milliseconds since the epoch
 
     @classmethod
     def from_notion(
@@ -26,22 +40,11 @@ class Client:
         """
         Create a Client from Notion page properties.
         """
-        properties = notion_dal.get_page_properties(page_id)
-
-        def get_text(prop):
-            if prop.get("title"):
-                return "".join([t["plain_text"] for t in prop["title"]])
-            if prop.get("rich_text"):
-                return "".join([t["plain_text"] for t in prop["rich_text"]])
-            return ""
-
-        client_name = get_text(properties.get("Project name", {}))
-        tag = get_text(properties.get("Tags", {}))
-
+        page = CLIENT_PAGE.project(notion_dal.retrieve_page(page_id))
         return cls(
             uuid=uuid,
-            tag=tag,
-            client_name=client_name,
+            tag=page.tags,
+            client_name=page.project_name,
             notion_page_id=page_id,
             notion_url=notion_url,
         )
@@ -97,6 +100,12 @@ class Client:
             "notion_url": self.notion_url,
             "google_drive": {k: asdict(v) for k, v in self.google_drive.items()},
             "notion": {k: asdict(v) for k, v in self.notion.items()},
+            "drive_changes_token": self.drive_changes_token,
+            "synced_next_posts": self.synced_next_posts,
+            "next_post_pages": self.next_post_pages,
+            "drive_channel_id": self.drive_channel_id,
+            "drive_channel_resource_id": self.drive_channel_resource_id,
+            "drive_channel_expiration": self.drive_channel_expiration,
         }
 
     @staticmethod
@@ -111,4 +120,10 @@ class Client:
             notion_url=data.get("notion_url", ""),
             google_drive=gd,
             notion=nt,
+            drive_changes_token=data.get("drive_changes_token"),
+            synced_next_posts=data.get("synced_next_posts", {}),
+            next_post_pages=data.get("next_post_pages", {}),
+            drive_channel_id=data.get("drive_channel_id"),
+            drive_channel_resource_id=data.get("drive_channel_resource_id"),
+            drive_channel_expiration=data.get("drive_channel_expiration"),
         )
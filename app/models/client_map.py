@@ -1,4 +1,6 @@
 import json
+import os
+import threading
 from typing import Dict, Optional
 
 from models.client import Client
@@ -7,25 +9,56 @@ from models.client import Client
 class ClientMap:
     def __init__(self):
         self.clients: Dict[str, Client] = {}
+        # Drive push-notification channel id -> client uuid
+        self._channel_index: Dict[str, str] = {}
+        self._save_lock = threading.Lock()
 
     def load_from_file(self, path: str):
         try:
             with open(path, "r") as f:
                 data = json.load(f)
                 for uuid, client_data in data.items():
-                    self.clients[uuid] = Client.from_dict(uuid, client_data)
+                    self.add_client(Client.from_dict(uuid, client_data))
         except FileNotFoundError:
             self.clients = {}
+            self._channel_index = {}
 
     def save_to_file(self, path: str):
-        with open(path, "w") as f:
-            json.dump(self.to_dict(), f, indent=2)
+        # Syncs and channel renewals save from different threads; write a
+        # temporary file and swap it in so readers never see a partial map
+        with self._save_lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+            os.replace(tmp_path, path)
 
     def get_client(self, uuid: str) -> Optional[Client]:
         return self.clients.get(uuid)
 
     def add_client(self, client: Client):
         self.clients[client.uuid] = client
+        if client.drive_channel_id:
+            self._channel_index[client.drive_channel_id] = client.uuid
+
+    def get_client_by_channel(self, channel_id: str) -> Optional[Client]:
+        uuid = self._channel_index.get(channel_id)
+        return self.clients.get(uuid) if uuid else None
+
+    def set_channel(
+        self,
+        client: Client,
+        channel_id: Optional[str],
+        resource_id: Optional[str] = None,
+        expiration: Optional[int] = None,
+    ):
+        """Record the client's current Drive channel (None clears it)."""
+        if client.drive_channel_id:
+            self._channel_index.pop(client.drive_channel_id, None)
+        client.drive_channel_id = channel_id
+        client.drive_channel_resource_id = resource_id
+        client.drive_channel_expiration = expiration
+        if channel_id:
+            self._channel_index[channel_id] = client.uuid
 
     @staticmethod
     def from_dict(uuid: str, data: dict) -> "Client":
@@ -0,0 +1,116 @@
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+
+
+def _text(objects) -> str:
+    return "".join(t.get("plain_text", "") for t in objects or [])
+
+
+def _plain(prop) -> str:
+    """Any scalar-ish property as a string (title, rich_text, number, formula, ...)."""
+    kind = prop.get("type")
+    value = prop.get(kind)
+    if kind in ("title", "rich_text"):
+        return _text(value)
+    if kind in ("status", "select"):
+        return (value or {}).get("name", "")
+    if kind == "formula":
+        value = (value or {}).get((value or {}).get("type"))
+    return "" if value is None else str(value)
+
+
+# Property kind -> (extractor, value when the property is missing)
+KINDS: Dict[str, Tuple[Callable[[dict], object], object]] = {
+    "title": (lambda p: _text(p.get("title")), ""),
+    "rich_text": (lambda p: _text(p.get("rich_text")), ""),
+    "text": (lambda p: _text(p.get("title") or p.get("rich_text")), ""),
+    "plain": (_plain, ""),
+    "status": (lambda p: (p.get("status") or {}).get("name"), None),
+    "select": (lambda p: (p.get("select") or {}).get("name"), None),
+    "url": (lambda p: p.get("url"), None),
+    "number": (lambda p: p.get("number"), None),
+    "date": (lambda p: (p.get("date") or {}).get("start"), None),
+    "relation": (lambda p: tuple(r["id"] for r in p.get("relation") or []), ()),
+}
+
+
+class Projection:
+    """
+    Compiles a {attribute: (property name, kind)} spec once into extractor
+    functions and a __slots__ record type, so large query results can be
+    reduced to a few fields per page and the raw JSON dropped.
+    Records always carry the page `id` and `last_edited_time`.
+    """
+
+    def __init__(self, name: str, **fields: Tuple[str, str]):
+        for attr, (_, kind) in fields.items():
+            if kind not in KINDS:
+                raise ValueError(f"Unknown property kind '{kind}' for {attr}")
+        self.fields = fields
+        self.record_type = type(
+            name,
+            (),
+            {
+                "__slots__": ("id", "last_edited_time") + tuple(fields),
+                "__repr__": _record_repr,
+                "to_dict": _record_to_dict,
+            },
+        )
+        self._extractors = tuple(
+            (attr, prop_name) + KINDS[kind]
+            for attr, (prop_name, kind) in fields.items()
+        )
+
+    def project(self, page: dict):
+        record = self.record_type()
+        record.id = page.get("id")
+        record.last_edited_time = page.get("last_edited_time")
+        properties = page.get("properties") or {}
+        for attr, prop_name, extract, default in self._extractors:
+            prop = properties.get(prop_name)
+            setattr(record, attr, extract(prop) if prop else default)
+        return record
+
+    def project_all(self, pages: Iterable[dict]) -> Iterator:
+        """Project pages lazily, e.g. straight from NotionDAL.iter_database."""
+        for page in pages:
+            yield self.project(page)
+
+
+def _record_repr(self) -> str:
+    values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+    return f"{type(self).__name__}({values})"
+
+
+def _record_to_dict(self) -> dict:
+    return {name: getattr(self, name) for name in self.__slots__}
+
+
+# Content database pages (one per post)
+CONTENT_PAGE = Projection(
+    "ContentPage",
+    identifier=("Identifier", "title"),
+    status=("Status", "status"),
+    caption=("Caption", "rich_text"),
+    image_description=("Image Description", "rich_text"),
+    drive_url=("Google Drive File", "url"),
+    client_ids=("Client", "relation"),
+    smm_ids=("Social Media Management", "relation"),
+)
+
+# Social Media Management pages (one per client cycle)
+SMM_PAGE = Projection(
+    "SmmPage",
+    cycle_id=("Cycle ID", "plain"),
+    cycle_start=("Cycle Start Date", "date"),
+    hashtags=("Hashtags", "rich_text"),
+    photo_posts=("Photo Posts", "number"),
+    short_videos=("Short Videos", "number"),
+    long_videos=("Long Videos", "number"),
+)
+
+# Client pages in the projects database
+CLIENT_PAGE = Projection(
+    "ClientPage",
+    project_name=("Project name", "text"),
+    tags=("Tags", "text"),
+)
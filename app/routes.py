@@ -1,9 +1,7 @@
 import urllib3
-from flask import jsonify, request, send_from_directory
+from flask import jsonify, make_response, request, send_from_directory, url_for
 from flask_cors import CORS
 
-from dal.google_drive_dal import GoogleDriveDAL
-
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
@@ -44,11 +42,18 @@ def register_routes(app):
 
     @app.route("/client/<client_uuid>/captions", methods=["GET"])
     def get_captions(client_uuid):
-        message, error = app.client_manager.get_captions_for_client(client_uuid)
+        digest, error = app.client_manager.get_caption_digest(client_uuid)
         if error:
             # Return error as plain text with 404
             return error, 404, {"Content-Type": "text/plain; charset=utf-8"}
-        return message, 200, {"Content-Type": "text/plain; charset=utf-8"}
+        response = make_response(
+            digest.message, 200, {"Content-Type": "text/plain; charset=utf-8"}
+        )
+        response.set_etag(digest.etag)
+        response.last_modified = digest.last_modified
+        # Browsers revalidate every time; unchanged digests come back as 304
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     @app.route("/client/<client_uuid>/images", methods=["GET"])
     def get_client_images(client_uuid):
@@ -63,13 +68,41 @@ def register_routes(app):
 
     @app.route("/images/<filename>")
     def serve_image(filename):
-        return send_from_directory(GoogleDriveDAL.IMAGES_DIR, filename)
+        size = request.args.get("size", "full")
+        if not app.image_derivatives.is_valid_size(size):
+            return jsonify({"error": f"Unknown image size '{size}'."}), 400
+        # Only serve files the cache knows about; also refreshes their LRU position
+        if not app.drive_dal.image_cache.touch(filename):
+            return jsonify({"error": f"Image {filename} not found."}), 404
+        directory, name = app.image_derivatives.get(filename, size)
+        return send_from_directory(directory, name, max_age=86400)
+
+    @app.route("/stats", methods=["GET"])
+    def get_stats():
+        return jsonify(
+            {
+                "image_cache": app.drive_dal.image_cache.stats(),
+                "drive_api": app.drive_dal.executor.stats(),
+                "drive_client_pool": app.drive_dal.client_pool.stats(),
+                "notion_api": app.notion_dal.stats(),
+                "smm_cache": app.client_manager.smm_cache.stats(),
+                "notion_content": app.client_manager.content_store.stats(),
+                "caption_digests": app.client_manager.caption_digests.stats(),
+                "label_cache": app.vision_service.stats(),
+                "gemini": app.gemini_service.stats(),
+            }
+        )
 
     @app.route("/client/<client_uuid>/generate-captions", methods=["POST"])
     def generate_captions(client_uuid):
         try:
-            app.client_manager.generate_captions_for_client(client_uuid)
-            return jsonify({"message": "Caption generation completed"}), 200
+            summary = app.client_manager.generate_captions_for_client(client_uuid)
+            return (
+                jsonify(
+                    {"message": "Caption generation completed", "summary": summary}
+                ),
+                200,
+            )
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -113,94 +146,19 @@ def register_routes(app):
                     400,
                 )
 
-            # Track results
-            processed_count = 0
-            errors = []
-
-            # Process each item
-            for item in items:
-                position = item.get("position")
-                is_carousel = item.get("isCarousel", False)
-                images = item.get("images", [])
-
-                for image in images:
-                    try:
-                        original_id = image.get("originalId", "")
-                        export_prefix = (
-                            image.get("exportFilename", "")
-                            .replace(".jpg", "")
-                            .replace(".jpeg", "")
-                            .replace(".png", "")
-                        )
-                        original_filename = image.get("originalFilename", "")
-
-                        if (
-                            not original_id
-                            or not export_prefix
-                            or not original_filename
-                        ):
-                            errors.append(
-                                f"Missing data for item at position {position}"
-                            )
-                            continue
-
-                        # Format the new filename with the prefix
-                        new_filename = f"{export_prefix}-{original_filename}"
-
-                        # Create file metadata for the copy
-                        file_metadata = {
-                            "name": new_filename,
-                            "parents": [next_post_id],
-                        }
-
-                        # Copy the file to the next_post_id folder with the new name
-                        copied_file = (
-                            app.drive_dal.service.files()
-                            .copy(
-                                fileId=original_id,
-                                body=file_metadata,
-                                fields="id, name",
-                            )
-                            .execute()
-                        )
-
-                        if copied_file and copied_file.get("id"):
-                            processed_count += 1
-                            app.logger.info(
-                                f"Exported {new_filename} to {client.client_name}'s next_post_id folder"
-                            )
-                        else:
-                            errors.append(f"Failed to copy file for {new_filename}")
-
-                    except HttpError as e:
-                        error_msg = (
-                            f"Google API error for position {position}: {str(e)}"
-                        )
-                        app.logger.error(error_msg)
-                        errors.append(error_msg)
-                    except Exception as e:
-                        error_msg = (
-                            f"Error processing image at position {position}: {str(e)}"
-                        )
-                        app.logger.error(error_msg)
-                        errors.append(error_msg)
-
-            # Generate response
-            if errors:
-                return jsonify(
-                    {
-                        "success": True,
-                        "message": f"Exported {processed_count} images with {len(errors)} errors",
-                        "errors": errors,
-                    }
-                )
-            else:
-                return jsonify(
+            # Copy in the background; the picker polls the job for progress
+            job = app.export_jobs.submit(client, next_post_id, items)
+            return (
+                jsonify(
                     {
                         "success": True,
-                        "message": f"Successfully exported {processed_count} images to {client.client_name}'s next posts folder",
+                        "message": f"Export of {len(job.items)} images to {client.client_name}'s next posts folder started",
+                        "jobId": job.id,
+                        "statusUrl": url_for("export_status", job_id=job.id),
                     }
-                )
+                ),
+                202,
+            )
 
         except Exception as e:
             app.logger.error(f"Export error: {str(e)}")
@@ -209,6 +167,18 @@ def register_routes(app):
                 500,
             )
 
+    @app.route("/export/<job_id>", methods=["GET"])
+    def export_status(job_id):
+        job = app.export_jobs.get(job_id)
+        if job is None:
+            return (
+                jsonify(
+                    {"success": False, "message": f"Export job not found: {job_id}"}
+                ),
+                404,
+            )
+        return jsonify({"success": True, **job})
+
     @app.route("/client", methods=["POST"])
     def create_client_from_notion():
         data = request.json
@@ -235,10 +205,53 @@ def register_routes(app):
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/drive-metadata/reconcile", methods=["POST"])
+    def reconcile_drive_metadata():
+        try:
+            folder_count = app.client_manager.reconcile_drive_metadata()
+            return (
+                jsonify({"message": f"Reconciled {folder_count} Drive folders"}),
+                200,
+            )
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/notion-content/sync", methods=["POST"])
+    def sync_notion_content():
+        full = request.args.get("mode", "incremental") == "full"
+        try:
+            count = app.client_manager.content_store.sync(full=full)
+            return jsonify({"message": f"Synced {count} Notion content pages"}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/drive-webhook", methods=["POST"])
+    def drive_webhook():
+        channel_id = request.headers.get("X-Goog-Channel-ID")
+        resource_state = request.headers.get("X-Goog-Resource-State")
+        if not channel_id or not resource_state:
+            return jsonify({"error": "Missing Drive channel headers"}), 400
+        # Drive only needs a quick 2xx; the sync runs in the background
+        app.channel_manager.handle_notification(
+            channel_id, resource_state, request.headers.get("X-Goog-Channel-Token")
+        )
+        return "", 200
+
+    @app.route("/drive-channels/renew", methods=["POST"])
+    def renew_drive_channels():
+        try:
+            opened = app.channel_manager.ensure_channels()
+            return jsonify({"message": f"Opened {opened} Drive channels"}), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     @app.route("/sync-next-posts/<client_uuid>", methods=["POST"])
     def sync_client_next_posts(client_uuid):
+        incremental = request.args.get("mode", "full") == "incremental"
         try:
-            app.client_manager.sync_next_posts_from_drive_to_notion(client_uuid)
-            return jsonify({"message": "Sync triggered"}), 200
+            summary = app.client_manager.sync_next_posts_from_drive_to_notion(
+                client_uuid, incremental=incremental
+            )
+            return jsonify({"message": "Sync completed", "summary": summary}), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 400
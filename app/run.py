@@ -1,7 +1,16 @@
 # run.py or wsgi.py
+import os
+
 from app import create_app
 
 app = create_app()
 
 if __name__ == "__main__":
+    # Only the reloader's child process, which serves requests, renews channels
+    if (
+        app.config["DRIVE_CHANNEL_SCHEDULER"]
+        and app.config["DRIVE_WEBHOOK_URL"]
+        and os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    ):
+        app.channel_manager.start()
     app.run(debug=True)
@@ -0,0 +1,326 @@
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from dal.rate_limit import TokenBucket
+
+_DONE = object()
+
+
+class SkipTask(Exception):
+    """Raised by a stage to drop a task without counting it as a failure."""
+
+
+@dataclass
+class CaptionTask:
+    """One "Suggest Captions" page travelling through the pipeline."""
+
+    page: object  # CONTENT_PAGE record
+    file_id: Optional[str] = None
+    prompt: Optional[str] = None
+    hashtags: Optional[List[str]] = None
+    image: Optional[bytes] = None
+    labels: Optional[List[str]] = None
+    gemini_prompt: Optional[str] = None
+    caption: Optional[str] = None
+    updated_page: Optional[dict] = None  # Notion's response to the write
+    error: Optional[str] = None
+
+
+class Stage:
+    """
+    A pipeline step run by `workers` threads. With requests_per_second set,
+    every call of fn first takes a token from the stage's own bucket, which is
+    shared by all runs of the pipeline.
+    With batch_size set, fn receives a list of up to batch_size tasks, gathered
+    for at most linger seconds after the first one arrives; it marks tasks it
+    could not handle by setting their error.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        workers: int = 1,
+        requests_per_second: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        linger: float = 1.0,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.batch_size = max(1, batch_size) if batch_size else None
+        self.linger = linger
+
+    def next_batch(self, inbox: queue.Queue):
+        """
+        Takes the next tasks from inbox; returns (tasks, done) where done means
+        the end-of-work marker was reached.
+        """
+        task = inbox.get()
+        if task is _DONE:
+            return [], True
+        tasks = [task]
+        deadline = time.monotonic() + self.linger
+        while len(tasks) < (self.batch_size or 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                task = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if task is _DONE:
+                return tasks, True
+            tasks.append(task)
+        return tasks, False
+
+
+class CaptionPipeline:
+    """
+    Generates captions for content pages in four stages: Drive download, Vision
+    labels, Gemini caption and Notion write. Stages are connected by bounded
+    queues and have their own worker counts and rate limits, so different
+    pages are downloaded, labelled and captioned at the same time and a run
+    takes about as long as its slowest stage. A full queue blocks the stage
+    feeding it, which keeps at most a few downloaded images in memory.
+    """
+
+    def __init__(
+        self,
+        drive_dal,
+        vision_service,
+        gemini_service,
+        notion_dal,
+        smm_cache,
+        download_workers: int = 4,
+        vision_workers: int = 2,
+        gemini_workers: int = 2,
+        write_workers: int = 2,
+        vision_requests_per_second: Optional[float] = None,
+        gemini_requests_per_second: Optional[float] = None,
+        vision_batch_size: int = 16,
+        gemini_batch_size: int = 8,
+        queue_size: int = 16,
+    ):
+        self.drive_dal = drive_dal
+        self.vision_service = vision_service
+        self.gemini_service = gemini_service
+        self.notion_dal = notion_dal
+        self.smm_cache = smm_cache
+        self.queue_size = queue_size
+        # Drive and Notion calls are already paced by their own clients
+        self.stages = [
+            Stage("download", self._download, download_workers),
+            # Images are labelled in batch_annotate_images requests
+            Stage(
+                "vision",
+                self._label,
+                vision_workers,
+                vision_requests_per_second,
+                batch_size=vision_batch_size,
+            ),
+            # Pages sharing an SMM prompt are captioned in one Gemini call
+            Stage(
+                "gemini",
+                self._generate,
+                gemini_workers,
+                gemini_requests_per_second,
+                batch_size=gemini_batch_size,
+            ),
+            Stage("write", self._write, write_workers),
+        ]
+
+    def run(self, pages: Iterable, on_written: Optional[Callable] = None) -> dict:
+        """
+        Caption every page and write the results to Notion.
+        :param on_written: called with each updated page returned by Notion.
+        :return: Summary with the number of pages captioned, skipped and failed,
+            the elapsed time and per-stage timings.
+        """
+        stages = self.stages
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        remaining = [stage.workers for stage in stages]
+        stats = [
+            {"processed": 0, "skipped": 0, "failed": 0, "busy_seconds": 0.0}
+            for _ in stages
+        ]
+        lock = threading.Lock()
+        captioned = []
+
+        def work(index):
+            stage = stages[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(stages) else None
+            done = False
+            while not done:
+                tasks, done = stage.next_batch(inbox)
+                if not tasks:
+                    continue
+                outcomes, busy = self._process(stage, tasks)
+                with lock:
+                    stats[index]["busy_seconds"] += busy
+                    for outcome in outcomes:
+                        stats[index][outcome] += 1
+                for task, outcome in zip(tasks, outcomes):
+                    if outcome != "processed":
+                        continue
+                    if outbox is not None:
+                        outbox.put(task)
+                        continue
+                    with lock:
+                        captioned.append(task)
+                    if on_written:
+                        try:
+                            on_written(task.updated_page)
+                        except Exception as e:
+                            print(f"WARNING: on_written failed for {task.page.id}: {e}")
+            # The last worker of a stage tells the next stage there is no more work
+            with lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                for _ in range(stages[index + 1].workers):
+                    outbox.put(_DONE)
+
+        threads = [
+            threading.Thread(
+                target=work, args=(i,), name=f"caption-{stage.name}-{n}", daemon=True
+            )
+            for i, stage in enumerate(stages)
+            for n in range(stage.workers)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        total = 0
+        try:
+            for page in pages:
+                queues[0].put(CaptionTask(page=page))
+                total += 1
+        finally:
+            # Even if listing pages fails, let the workers drain and exit
+            for _ in range(stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        summary = {
+            "pages": total,
+            "captioned": len(captioned),
+            "skipped": sum(s["skipped"] for s in stats),
+            "failed": sum(s["failed"] for s in stats),
+            "elapsed_seconds": time.monotonic() - start,
+            "stages": {stage.name: s for stage, s in zip(stages, stats)},
+        }
+        print(
+            f"Caption run: {summary['captioned']}/{total} captioned, "
+            f"{summary['skipped']} skipped, {summary['failed']} failed "
+            f"in {summary['elapsed_seconds']:.1f}s"
+        )
+        return summary
+
+    @staticmethod
+    def _process(stage: Stage, tasks: List[CaptionTask]):
+        """Runs one stage call; returns (outcome per task, busy seconds)."""
+        if stage.bucket:
+            stage.bucket.acquire()
+        start = time.monotonic()
+        try:
+            stage.fn(tasks if stage.batch_size else tasks[0])
+        except SkipTask as e:
+            for task in tasks:
+                print(f"Page {task.page.id}: {e}, skipping.")
+            return ["skipped"] * len(tasks), time.monotonic() - start
+        except Exception as e:
+            for task in tasks:
+                task.error = f"{stage.name}: {e}"
+            traceback.print_exc()
+        outcomes = []
+        for task in tasks:
+            if task.error:
+                print(f"Exception processing page {task.page.id}: {task.error}")
+                outcomes.append("failed")
+            else:
+                outcomes.append("processed")
+        return outcomes, time.monotonic() - start
+
+    def _download(self, task: CaptionTask):
+        page = task.page
+        if not page.smm_ids:
+            raise SkipTask("no SMM relation")
+        task.file_id = page.drive_url.split("/d/")[1].split("/")[0]
+        smm_page_id = page.smm_ids[0]
+        task.prompt = self.smm_cache.get_prompt(smm_page_id)
+        task.hashtags = list(self.smm_cache.get(smm_page_id).hashtags)
+        metadata = self.drive_dal.get_file_metadata(task.file_id)
+        # A photo labelled before needs neither the download nor Vision
+        task.labels = self.vision_service.cached_labels(metadata.get("md5Checksum"))
+        if task.labels is not None:
+            return
+        # Served from the image cache when the file was downloaded before
+        task.image = self.drive_dal.read_file(task.file_id, metadata=metadata)
+        if not task.image:
+            raise SkipTask(f"image content for file {task.file_id} is empty")
+
+    def _label(self, tasks: List[CaptionTask]):
+        tasks = [t for t in tasks if t.labels is None]
+        if not tasks:
+            return
+        labels = self.vision_service.get_labels_batch([t.image for t in tasks])
+        for task, task_labels in zip(tasks, labels):
+            # Labels are all later stages need; free the image early
+            task.image = None
+            if task_labels is None:
+                task.error = "vision: no labels returned"
+            task.labels = task_labels
+
+    def _generate(self, tasks: List[CaptionTask]):
+        groups = {}
+        for task in tasks:
+            task.gemini_prompt = self.gemini_service.build_prompt(
+                task.labels,
+                task.prompt,
+                task.hashtags,
+                image_description=task.page.image_description,
+            )
+            groups.setdefault((task.prompt, tuple(task.hashtags)), []).append(task)
+
+        for (prompt, hashtags), group in groups.items():
+            # A caption whose Notion write failed is reused when the same page
+            # is retried; other pages with identical inputs get their own
+            captions = self.gemini_service.generate_captions_batch(
+                [(t.labels, t.page.image_description) for t in group],
+                prompt,
+                list(hashtags),
+                reuse_keys=[t.page.id for t in group],
+            )
+            for task, caption in zip(group, captions):
+                task.caption = caption
+                if caption is None:
+                    task.error = "gemini: no caption generated"
+
+    def _write(self, task: CaptionTask):
+        # The suggestion goes in the page body for review; the Caption
+        # property stays whatever a person wrote there
+        self.notion_dal.append_blocks(
+            task.page.id,
+            [
+                {
+                    "object": "block",
+                    "type": "paragraph",
+                    "paragraph": {"rich_text": self.notion_dal.rich_text(task.caption)},
+                }
+            ],
+        )
+        task.updated_page = self.notion_dal.update_page(
+            task.page.id,
+            properties={"Status": {"status": {"name": "Caption Generated"}}},
+        )
+        # Saved; moving the page back to Suggest Captions asks for a new caption
+        self.gemini_service.discard(task.gemini_prompt, task.page.id)
+        print(f"Processed page {task.page.id} successfully.")
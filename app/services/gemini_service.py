@@ -1,24 +1,257 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class GeminiService:
-    def __init__(self, api_key):
+    """
+    Caption generation over the Gemini REST API.
+    Requests share one pooled requests.Session. Callers passing a reuse_key
+    (e.g. the Notion page id) get the caption cached for that key, model and
+    normalized prompt for ttl seconds, or join an identical request for the
+    same key that is already in flight, instead of paying for another
+    generation. Different keys never share a caption.
+    generate_captions_batch captions several images sharing one SMM prompt in
+    a single call with a JSON response schema.
+    """
+
+    MAX_BATCH_SIZE = 10  # images per batched generateContent call
+    BATCH_RESPONSE_SCHEMA = {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "index": {"type": "INTEGER"},
+                "caption": {"type": "STRING"},
+            },
+            "required": ["index", "caption"],
+        },
+    }
+
+    def __init__(
+        self,
+        api_key,
+        model="gemini-2.0-flash",
+        cache_ttl=3600,
+        cache_size=1024,
+        timeout=60,
+        pool_size=8,
+    ):
         self.api_key = api_key
-        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
+        self.model = model
+        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={self.api_key}"
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        self._cache = OrderedDict()  # key -> (caption, stored_at)
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "hits": 0, "joined": 0}
 
-    def generate_caption(self, labels, prompt, hashtags, image_description=None):
+    @staticmethod
+    def build_prompt(labels, prompt, hashtags, image_description=None):
         image_desc_part = ""
         if image_description:
             image_desc_part = f" The image is described as: '{image_description.strip()}'. Give this description high importance in the caption."
 
-        input_text = (
+        return (
             f"Generate a social media caption based on the following prompt: '{prompt.strip()}'."
             f"{image_desc_part} The image has these labels: {', '.join(labels)}."
             f" Include these hashtags: {', '.join(hashtags)}."
             f" Keep the caption under 50 words."
         )
+
+    def generate_caption(
+        self, labels, prompt, hashtags, image_description=None, reuse_key=None
+    ):
+        input_text = self.build_prompt(labels, prompt, hashtags, image_description)
+        return self.generate(input_text, reuse_key=reuse_key)
+
+    def generate(self, input_text, reuse_key=None):
+        """
+        Text generated for input_text. With a reuse_key, a cached response for
+        the same key and prompt is returned and identical concurrent calls for
+        that key share one request.
+        """
+        if reuse_key is None:
+            return self._post(input_text)
+
+        key = self.cache_key(input_text, reuse_key)
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self._counters["joined"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            caption = self._store(key, self._post(input_text))
+            future.set_result(caption)
+            return caption
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    @staticmethod
+    def build_batch_prompt(items, prompt, hashtags):
+        """Prompt asking for one caption per (labels, image_description) item."""
+        lines = [
+            f"Generate one social media caption for each image below, based on the following prompt: '{prompt.strip()}'.",
+            f"Include these hashtags in every caption: {', '.join(hashtags)}.",
+            "Keep each caption under 50 words. When an image has a description, give it high importance in that image's caption.",
+            "Return one object per image with its index and caption.",
+        ]
+        for index, (labels, image_description) in enumerate(items):
+            line = f"Image {index}: labels: {', '.join(labels)}."
+            if image_description:
+                line += f" Described as: '{image_description.strip()}'."
+            lines.append(line)
+        return "\n".join(lines)
+
+    def generate_captions_batch(self, items, prompt, hashtags, reuse_keys=None):
+        """
+        Captions for several images that share prompt and hashtags.
+        :param items: (labels, image_description) per image.
+        :param reuse_keys: Optional reuse_key per item, as for generate.
+        :return: One caption per item, in order; None where generation failed.
+        Items the batch response leaves out or gets wrong are generated one by
+        one. Results are cached under the same key generate_caption uses.
+        """
+        prompts = [
+            self.build_prompt(labels, prompt, hashtags, image_description)
+            for labels, image_description in items
+        ]
+        reuse_keys = list(reuse_keys) if reuse_keys else [None] * len(items)
+        keys = [
+            self.cache_key(p, r) if r is not None else None
+            for p, r in zip(prompts, reuse_keys)
+        ]
+        with self._lock:
+            captions = [self._lookup(key) if key else None for key in keys]
+
+        pending = [i for i, caption in enumerate(captions) if caption is None]
+        for start in range(0, len(pending), self.MAX_BATCH_SIZE):
+            chunk = pending[start : start + self.MAX_BATCH_SIZE]
+            if len(chunk) < 2:
+                continue
+            try:
+                batch_text = self.build_batch_prompt(
+                    [items[i] for i in chunk], prompt, hashtags
+                )
+                parsed = self._parse_batch(self._post_batch(batch_text), len(chunk))
+            except Exception as e:
+                print(f"Batched caption generation failed, falling back: {e}")
+                continue
+            for position, caption in parsed.items():
+                index = chunk[position]
+                captions[index] = (
+                    self._store(keys[index], caption) if keys[index] else caption
+                )
+
+        for index, caption in enumerate(captions):
+            if caption is not None:
+                continue
+            try:
+                captions[index] = self.generate(
+                    prompts[index], reuse_key=reuse_keys[index]
+                )
+            except Exception as e:
+                print(f"Caption generation failed for item {index}: {e}")
+        return captions
+
+    def discard(self, input_text, reuse_key):
+        """Forget the cached response, e.g. once the caption has been saved."""
+        with self._lock:
+            self._cache.pop(self.cache_key(input_text, reuse_key), None)
+
+    def cache_key(self, input_text, reuse_key):
+        normalized = " ".join(input_text.split())
+        return hashlib.sha256(
+            f"{self.model}\n{reuse_key}\n{normalized}".encode("utf-8")
+        ).hexdigest()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached"] = len(self._cache)
+            stats["in_flight"] = len(self._in_flight)
+        return stats
+
+    def _lookup(self, key):
+        # Caller holds self._lock
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[1] <= self.cache_ttl:
+            self._cache.move_to_end(key)
+            self._counters["hits"] += 1
+            return cached[0]
+        return None
+
+    def _post_batch(self, input_text):
+        return self._post(
+            input_text,
+            generation_config={
+                "responseMimeType": "application/json",
+                "responseSchema": self.BATCH_RESPONSE_SCHEMA,
+            },
+        )
+
+    @staticmethod
+    def _parse_batch(text, count):
+        """{position: caption} for the well-formed items of a batch response."""
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("batch response is not a JSON array")
+        captions = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            index, caption = item.get("index"), item.get("caption")
+            if (
+                isinstance(index, int)
+                and 0 <= index < count
+                and index not in captions
+                and isinstance(caption, str)
+                and caption.strip()
+            ):
+                captions[index] = caption.strip()
+        if len(captions) < count:
+            print(f"Batch response covered {len(captions)} of {count} images")
+        return captions
+
+    def _post(self, input_text, generation_config=None):
         payload = {"contents": [{"parts": [{"text": input_text}]}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
         headers = {"Content-Type": "application/json"}
-        response = requests.post(self.url, json=payload, headers=headers)
+        with self._lock:
+            self._counters["requests"] += 1
+        response = self.session.post(
+            self.url, json=payload, headers=headers, timeout=self.timeout
+        )
         response.raise_for_status()
         return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+    def _store(self, key, caption):
+        with self._lock:
+            self._cache[key] = (caption, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return caption
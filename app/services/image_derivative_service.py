@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Tuple
+
+from PIL import Image, ImageOps
+
+
+class ImageDerivativeService:
+    """
+    Produces downscaled JPEG derivatives (thumbnail, preview) of images in the
+    image cache, generating each one the first time it is requested or in the
+    background after download. Their bytes count towards the image cache budget
+    and they are removed together with their source when the cache evicts it.
+    """
+
+    FULL = "full"
+    SIZES = {"thumbnail": 320, "preview": 1280}  # longest edge in pixels
+    JPEG_QUALITY = 80
+
+    def __init__(self, image_cache, max_workers: int = 2):
+        self.image_cache = image_cache
+        self.directory = os.path.join(image_cache.directory, "derivatives")
+        for size in self.SIZES:
+            os.makedirs(os.path.join(self.directory, size), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_progress = {}
+        self._lock = threading.Lock()
+        image_cache.on_evict(self.remove_derivatives)
+
+    @classmethod
+    def is_valid_size(cls, size: str) -> bool:
+        return size == cls.FULL or size in cls.SIZES
+
+    @staticmethod
+    def derivative_name(key: str) -> str:
+        return f"{os.path.splitext(key)[0]}.jpg"
+
+    def get(self, key: str, size: str) -> Tuple[str, str]:
+        """
+        Returns (directory, filename) of the requested size of a cached image,
+        generating the derivative if needed. Falls back to the full image when
+        the source cannot be resized.
+        """
+        if size == self.FULL:
+            return self.image_cache.directory, key
+        name = self.derivative_name(key)
+        size_dir = os.path.join(self.directory, size)
+        if os.path.exists(os.path.join(size_dir, name)) or self._generate(key, size):
+            return size_dir, name
+        return self.image_cache.directory, key
+
+    def generate_in_background(self, keys: Iterable[str], sizes=("thumbnail",)):
+        """Queue derivative generation so the first page load finds them ready."""
+        for key in keys:
+            for size in sizes:
+                name = self.derivative_name(key)
+                if not os.path.exists(os.path.join(self.directory, size, name)):
+                    self._executor.submit(self._generate, key, size)
+
+    def remove_derivatives(self, key: str):
+        name = self.derivative_name(key)
+        for size in self.SIZES:
+            try:
+                os.remove(os.path.join(self.directory, size, name))
+            except FileNotFoundError:
+                pass
+
+    def _generate(self, key: str, size: str) -> bool:
+        # Concurrent requests for the same derivative wait on a single resize
+        with self._lock:
+            event = self._in_progress.get((key, size))
+            owner = event is None
+            if owner:
+                event = self._in_progress[(key, size)] = threading.Event()
+        if not owner:
+            event.wait()
+            return os.path.exists(
+                os.path.join(self.directory, size, self.derivative_name(key))
+            )
+
+        target = os.path.join(self.directory, size, self.derivative_name(key))
+        try:
+            max_edge = self.SIZES[size]
+            with Image.open(self.image_cache.path(key)) as img:
+                # Camera JPEGs carry their orientation in EXIF
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                tmp_path = f"{target}.{threading.get_ident()}.tmp"
+                img.convert("RGB").save(
+                    tmp_path,
+                    "JPEG",
+                    quality=self.JPEG_QUALITY,
+                    optimize=True,
+                    progressive=True,
+                )
+            os.replace(tmp_path, target)
+            if not self.image_cache.add_related_bytes(key, os.path.getsize(target)):
+                # The source was evicted while resizing
+                os.remove(target)
+                return False
+            return True
+        except Exception as e:
+            print(f"Failed to generate {size} derivative for {key}: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._in_progress.pop((key, size), None)
+            event.set()
@@ -1,13 +1,105 @@
+import hashlib
+from typing import List, Optional
+
 from google.cloud import vision
 
 
 class VisionService:
-    def __init__(self, service_account_json):
+    BATCH_SIZE = 16  # images per batch_annotate_images request
+    # Vision rejects requests over 10 MB; leave room for base64 and framing
+    MAX_REQUEST_BYTES = 7 * 1024**2
+
+    def __init__(self, service_account_json, max_results: int = 10, label_cache=None):
         self.client = vision.ImageAnnotatorClient.from_service_account_file(
             service_account_json
         )
+        self.max_results = max_results
+        # Optional dal.label_cache.LabelCache, consulted before calling Vision
+        self.label_cache = label_cache
+
+    @staticmethod
+    def content_hash(image_content: bytes) -> str:
+        """Same value as the Drive md5Checksum of the file."""
+        return hashlib.md5(image_content).hexdigest()
 
-    def get_labels(self, image_content):
+    def cached_labels(self, content_hash: Optional[str]) -> Optional[List[str]]:
+        """Labels recorded for this content, without needing the image itself."""
+        if not self.label_cache or not content_hash:
+            return None
+        return self.label_cache.get(content_hash, self.max_results)
+
+    def get_labels(self, image_content, content_hash: Optional[str] = None):
+        content_hash = content_hash or self.content_hash(image_content)
+        labels = self.cached_labels(content_hash)
+        if labels is not None:
+            return labels
         image = vision.Image(content=image_content)
-        response = self.client.label_detection(image=image)
-        return [label.description for label in response.label_annotations]
+        response = self.client.label_detection(
+            image=image, max_results=self.max_results
+        )
+        labels = [label.description for label in response.label_annotations]
+        self._record(content_hash, labels)
+        return labels
+
+    def get_labels_batch(self, images: List[bytes]) -> List[Optional[List[str]]]:
+        """
+        Labels for many images, at most BATCH_SIZE images and MAX_REQUEST_BYTES
+        of content per request (a larger image is sent on its own). Images
+        already in the label cache are not sent.
+        Returns one entry per image, in order; None where Vision reported an
+        error for that image or its request failed.
+        """
+        hashes = [self.content_hash(content) for content in images]
+        cached = (
+            self.label_cache.get_many(hashes, self.max_results)
+            if self.label_cache
+            else {}
+        )
+        labels = [cached.get(h) for h in hashes]
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+
+        feature = vision.Feature(
+            type_=vision.Feature.Type.LABEL_DETECTION, max_results=self.max_results
+        )
+        for indexes in self._chunks(missing, images):
+            requests = [
+                vision.AnnotateImageRequest(
+                    image=vision.Image(content=images[i]), features=[feature]
+                )
+                for i in indexes
+            ]
+            try:
+                response = self.client.batch_annotate_images(requests=requests)
+            except Exception as e:
+                print(f"Vision request for images {indexes} failed: {e}")
+                continue
+            for index, result in zip(indexes, response.responses):
+                if result.error.message:
+                    print(f"Vision failed for image {index}: {result.error.message}")
+                    continue
+                labels[index] = [l.description for l in result.label_annotations]
+                self._record(hashes[index], labels[index])
+        return labels
+
+    def _chunks(self, indexes: List[int], images: List[bytes]):
+        """Groups indexes into requests within BATCH_SIZE and MAX_REQUEST_BYTES."""
+        chunk, chunk_bytes = [], 0
+        for index in indexes:
+            size = len(images[index])
+            if chunk and (
+                len(chunk) == self.BATCH_SIZE
+                or chunk_bytes + size > self.MAX_REQUEST_BYTES
+            ):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(index)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    def stats(self) -> dict:
+        return self.label_cache.stats() if self.label_cache else {}
+
+    def _record(self, content_hash: str, labels: List[str]):
+        if self.label_cache:
+            self.label_cache.put(content_hash, self.max_results, labels)
@@ -0,0 +1,14 @@
+"""
+Notion client and page projections from app/, for the root-level scripts.
+Deploy app/ together with the script that imports this module.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from dal.notion_scheduler import ScheduledNotionClient  # noqa: E402
+from models.notion_projection import CONTENT_PAGE, SMM_PAGE  # noqa: E402
+
+__all__ = ["CONTENT_PAGE", "SMM_PAGE", "ScheduledNotionClient"]
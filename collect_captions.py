@@ -3,8 +3,10 @@ import os
 import sys
 import traceback
 
-from notion_client import Client as NotionClient
 from notion_client.errors import APIResponseError
+from notion_client.helpers import iterate_paginated_api
+
+from app_shared import CONTENT_PAGE, SMM_PAGE, ScheduledNotionClient
 
 CLIENT_MAP_FILE = "client_map.json"
 if not os.path.exists(CLIENT_MAP_FILE):
@@ -19,9 +21,16 @@ else:
             CLIENT_MAP = {}
 
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN")
+NOTION_REQUESTS_PER_SECOND = float(os.environ.get("NOTION_REQUESTS_PER_SECOND", "3"))
 NOTION_DB_ID = "1e8add08074880faa661d372bdb63bce"  # Update if needed
 
-notion = NotionClient(auth=NOTION_TOKEN) if NOTION_TOKEN else None
+notion = (
+    ScheduledNotionClient(
+        auth=NOTION_TOKEN, requests_per_second=NOTION_REQUESTS_PER_SECOND
+    )
+    if NOTION_TOKEN
+    else None
+)
 
 
 def get_cycle_id_from_social_media_management(social_media_management_id):
@@ -32,36 +41,14 @@ def get_cycle_id_from_social_media_management(social_media_management_id):
         )
         return None
     try:
-        page = notion.pages.retrieve(social_media_management_id)
-        properties = page.get("properties", {})
-        cycle_id_prop = properties.get("Cycle ID")
-        if not cycle_id_prop:
+        smm = SMM_PAGE.project(notion.pages.retrieve(social_media_management_id))
+        if not smm.cycle_id:
             print(
-                f"WARNING: 'Cycle ID' property not found on Social Media Management page {social_media_management_id}.",
+                f"WARNING: 'Cycle ID' not set on Social Media Management page {social_media_management_id}.",
                 file=sys.stderr,
             )
             return None
-        # Cycle ID is usually a 'rich_text' or 'title' type, handle both
-        if cycle_id_prop["type"] == "rich_text":
-            texts = cycle_id_prop["rich_text"]
-            if texts:
-                return texts[0]["plain_text"]
-        elif cycle_id_prop["type"] == "title":
-            texts = cycle_id_prop["title"]
-            if texts:
-                return texts[0]["plain_text"]
-        elif cycle_id_prop["type"] == "number":
-            return str(cycle_id_prop["number"])
-        elif cycle_id_prop["type"] == "formula":
-            return str(
-                cycle_id_prop["formula"].get("string", "")
-            )  # if formula returns string
-        else:
-            print(
-                f"WARNING: Unhandled Cycle ID property type: {cycle_id_prop['type']}",
-                file=sys.stderr,
-            )
-        return None
+        return smm.cycle_id
     except Exception as e:
         print(
             f"ERROR: Failed to fetch Cycle ID from Social Media Management page: {e}",
@@ -93,7 +80,9 @@ def get_captions_for_client(client_name):
 
     identifier_prefix = f"{cycle_id} "
     try:
-        results = notion.databases.query(
+        # Follow next_cursor so cycles with more than one page of posts are complete
+        items = iterate_paginated_api(
+            notion.databases.query,
             **{
                 "database_id": NOTION_DB_ID,
                 "filter": {
@@ -109,28 +98,20 @@ def get_captions_for_client(client_name):
                     ]
                 },
                 "page_size": 100,
-            }
+            },
         )
-        items = results.get("results", [])
         posts = []
-        for page in items:
-            props = page.get("properties", {})
-            identifier_prop = props.get("Identifier", {})
+        for page in CONTENT_PAGE.project_all(items):
+            identifier_text = page.identifier
             number = None
-            if identifier_prop.get("type") == "title":
-                title_objs = identifier_prop.get("title", [])
-                if title_objs:
-                    identifier_text = title_objs[0].get("plain_text", "")
-                    if identifier_text.startswith(identifier_prefix):
-                        try:
-                            number = int(
-                                identifier_text[len(identifier_prefix) :].strip()
-                            )
-                        except ValueError:
-                            print(
-                                f"WARNING: Could not parse number from Identifier: '{identifier_text}'",
-                                file=sys.stderr,
-                            )
+            if identifier_text.startswith(identifier_prefix):
+                try:
+                    number = int(identifier_text[len(identifier_prefix) :].strip())
+                except ValueError:
+                    print(
+                        f"WARNING: Could not parse number from Identifier: '{identifier_text}'",
+                        file=sys.stderr,
+                    )
             if number is not None:
                 posts.append((number, identifier_text))
         if not posts:
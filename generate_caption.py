@@ -9,7 +9,8 @@ from flask import Flask, request
 from google.cloud import vision
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from notion_client import Client as NotionClient
+
+from app_shared import CONTENT_PAGE, SMM_PAGE, ScheduledNotionClient
 
 # Setup logging
 logging.basicConfig(
@@ -20,6 +21,7 @@ logging.basicConfig(
 
 # Environment variables
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN")
+NOTION_REQUESTS_PER_SECOND = float(os.environ.get("NOTION_REQUESTS_PER_SECOND", "3"))
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 SERVICE_ACCOUNT_FILE = "service-account.json"
 
@@ -28,7 +30,9 @@ if not NOTION_TOKEN:
     logging.error("NOTION_TOKEN environment variable not set.")
     notion = None
 else:
-    notion = NotionClient(auth=NOTION_TOKEN)
+    notion = ScheduledNotionClient(
+        auth=NOTION_TOKEN, requests_per_second=NOTION_REQUESTS_PER_SECOND
+    )
     logging.info("Notion client initialised.")
 
 
@@ -99,13 +103,8 @@ def get_notion_page(page_id):
 def get_smm_page(smm_page_id):
     """Retrieve the Social Media Management page details."""
     logging.info(f"Retrieving SMM page with id: {smm_page_id}")
-    smm_page = notion.pages.retrieve(smm_page_id)
-    hashtags_prop = smm_page["properties"]["Hashtags"]["rich_text"]
-    if hashtags_prop:
-        hashtags_text = "".join([t["plain_text"] for t in hashtags_prop])
-        hashtags = [h.strip() for h in hashtags_text.split() if h.strip()]
-    else:
-        hashtags = []
+    smm_page = SMM_PAGE.project(notion.pages.retrieve(smm_page_id))
+    hashtags = smm_page.hashtags.split()
     logging.info(f"Extracted hashtags: {hashtags}")
     blocks = notion.blocks.children.list(block_id=smm_page_id)
     prompt = ""
@@ -126,23 +125,13 @@ def generate_caption_handler(request):
             return ("", 400)
 
         page_id = data["page_id"]
-        page = get_notion_page(page_id)
-        properties = page["properties"]
+        page = CONTENT_PAGE.project(get_notion_page(page_id))
 
-        # Extract Image Description
-        image_description = ""
-        try:
-            image_desc_prop = properties.get("Image Description", {}).get(
-                "rich_text", []
-            )
-            if image_desc_prop:
-                image_description = "".join([t["plain_text"] for t in image_desc_prop])
-            logging.info(f"Image Description: {image_description}")
-        except Exception as e:
-            logging.warning(f"Could not extract image description: {e}")
+        image_description = page.image_description
+        logging.info(f"Image Description: {image_description}")
 
         # Check status
-        status = properties["Status"]["status"]["name"]
+        status = page.status
         logging.info(f"Page {page_id} status: {status}")
         if status != "Suggest Captions":
             logging.info(
@@ -151,7 +140,7 @@ def generate_caption_handler(request):
             return ("Status not 'Suggest Captions'", 200)
 
         # Extract Google Drive file ID
-        drive_url = properties["Google Drive File"]["url"]
+        drive_url = page.drive_url
         try:
             file_id = drive_url.split("/d/")[1].split("/")[0]
             logging.info(f"Extracted file_id: {file_id} from URL: {drive_url}")
@@ -162,11 +151,10 @@ def generate_caption_handler(request):
             return ("", 400)
 
         # Get prompt and hashtags from Social Media Management page
-        smm_relation = properties["Social Media Management"]["relation"]
-        if not smm_relation:
+        if not page.smm_ids:
             logging.error(f"No Social Media Management relation for page {page_id}.")
             return ("", 400)
-        smm_page_id = smm_relation[0]["id"]
+        smm_page_id = page.smm_ids[0]
         prompt, hashtags = get_smm_page(smm_page_id)
 
         # Process image and generate caption
@@ -8,9 +8,10 @@ from collections import defaultdict
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from notion_client import Client as NotionClient
 from notion_client.errors import APIResponseError
 
+from app_shared import SMM_PAGE, ScheduledNotionClient
+
 # --- Load channel map at module load ---
 CLIENT_MAP_FILE = "client_map.json"
 if not os.path.exists(CLIENT_MAP_FILE):
@@ -24,17 +25,29 @@ else:
             print(f"ERROR: Failed to load {CLIENT_MAP_FILE}: {e}", file=sys.stderr)
             CHANNEL_MAP = {}
 
+# Notifications carry the channel id the app's channel manager stored on each
+# client; index them once so every webhook is a dict lookup. Clients without a
+# managed channel can still be addressed by their uuid.
+CHANNEL_INDEX = {
+    client_info["drive_channel_id"]: client_uuid
+    for client_uuid, client_info in CHANNEL_MAP.items()
+    if client_info.get("drive_channel_id")
+}
+
 SERVICE_ACCOUNT_FILE = "service-account.json"
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN")  # Set as env var for deployment
+NOTION_REQUESTS_PER_SECOND = float(os.environ.get("NOTION_REQUESTS_PER_SECOND", "3"))
 NOTION_DB_ID = "1e8add08074880faa661d372bdb63bce"  # Your Notion database ID
 
 if not NOTION_TOKEN:
     print("ERROR: NOTION_TOKEN environment variable not set.", file=sys.stderr)
     notion = None
 else:
-    notion = NotionClient(auth=NOTION_TOKEN)
+    notion = ScheduledNotionClient(
+        auth=NOTION_TOKEN, requests_per_second=NOTION_REQUESTS_PER_SECOND
+    )
 
 
 def get_service():
@@ -133,36 +146,14 @@ def get_cycle_id_from_social_media_management(social_media_management_id):
         )
         return None
     try:
-        page = notion.pages.retrieve(social_media_management_id)
-        properties = page.get("properties", {})
-        cycle_id_prop = properties.get("Cycle ID")
-        if not cycle_id_prop:
+        smm = SMM_PAGE.project(notion.pages.retrieve(social_media_management_id))
+        if not smm.cycle_id:
             print(
-                f"WARNING: 'Cycle ID' property not found on Social Media Management page {social_media_management_id}.",
+                f"WARNING: 'Cycle ID' not set on Social Media Management page {social_media_management_id}.",
                 file=sys.stderr,
             )
             return None
-        # Cycle ID is usually a 'rich_text' or 'title' type, handle both
-        if cycle_id_prop["type"] == "rich_text":
-            texts = cycle_id_prop["rich_text"]
-            if texts:
-                return texts[0]["plain_text"]
-        elif cycle_id_prop["type"] == "title":
-            texts = cycle_id_prop["title"]
-            if texts:
-                return texts[0]["plain_text"]
-        elif cycle_id_prop["type"] == "number":
-            return str(cycle_id_prop["number"])
-        elif cycle_id_prop["type"] == "formula":
-            return str(
-                cycle_id_prop["formula"].get("string", "")
-            )  # if formula returns string
-        else:
-            print(
-                f"WARNING: Unhandled Cycle ID property type: {cycle_id_prop['type']}",
-                file=sys.stderr,
-            )
-        return None
+        return smm.cycle_id
     except Exception as e:
         print(
             f"ERROR: Failed to fetch Cycle ID from Social Media Management page: {e}",
@@ -200,8 +191,16 @@ def add_content_to_notion_grouped(
 
     try:
         file_url = f"https://drive.google.com/file/d/{file_id}/view?usp=drive_web"
-        # 1. Create the page with properties (including the URL property)
-        page = notion.pages.create(
+        # Embed blocks for all images in body_images
+        children = []
+        for file in body_images:
+            embed_url = f"https://drive.google.com/file/d/{file['id']}/preview"
+            children.append(
+                {"object": "block", "type": "embed", "embed": {"url": embed_url}}
+            )
+
+        # Create the page with its properties and embeds in a single request
+        notion.pages.create(
             parent={"database_id": NOTION_DB_ID},
             properties={
                 "Identifier": {"title": [{"text": {"content": identifier}}]},
@@ -213,18 +212,6 @@ def add_content_to_notion_grouped(
                 "Status": {"status": {"name": "Draft"}},
                 "Client": {"relation": [{"id": client_notion_id}]},
             },
-        )
-        page_id = page["id"]
-
-        # 2. Append embed blocks for all images in body_images
-        children = []
-        for file in body_images:
-            embed_url = f"https://drive.google.com/file/d/{file['id']}/preview"
-            children.append(
-                {"object": "block", "type": "embed", "embed": {"url": embed_url}}
-            )
-        notion.blocks.children.append(
-            block_id=page_id,
             children=children,
         )
 
@@ -254,11 +241,14 @@ def drive_webhook(request):
             print("ERROR: Missing X-Goog-Resource-State header.", file=sys.stderr)
             return ("", 400)
 
-        if channel_id not in CHANNEL_MAP:
+        client_uuid = CHANNEL_INDEX.get(channel_id)
+        if client_uuid is None and channel_id in CHANNEL_MAP:
+            client_uuid = channel_id
+        if client_uuid is None:
             print(f"Ignoring event: unknown channel ID {channel_id}")
             return ("", 200)
 
-        client_info = CHANNEL_MAP[channel_id]
+        client_info = CHANNEL_MAP[client_uuid]
         client_id = client_info["notion"]["client_id"]
         social_media_managment_id = client_info["notion"]["social_media_managment_id"]
         client_name = client_info["client_name"]
@@ -266,8 +256,9 @@ def drive_webhook(request):
         fotos_id = client_info["google_drive"]["fotos_id"]
         scheduling_id = client_info["google_drive"]["scheduling_id"]
 
-        # Only process if this is an 'add' or 'change' event
-        if resource_state not in ["add", "change"]:
+        # Only process add/change events ('update' is what files.watch on a
+        # folder sends when its children change)
+        if resource_state not in ["add", "change", "update"]:
             print(f"Ignoring event: resource_state '{resource_state}' not actionable.")
             return ("", 200)
 
@@ -276,6 +267,9 @@ def drive_webhook(request):
             print("ERROR: Google Drive service not available.", file=sys.stderr)
             return ("", 500)
 
+        # Always a full listing: this function runs from a read-only deploy
+        # directory and cannot keep a Changes API cursor. Incremental syncs
+        # run in the app (see ClientManager.sync_next_posts_from_drive_to_notion).
         try:
             results = (
                 service.files()